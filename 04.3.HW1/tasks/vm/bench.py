@@ -0,0 +1,389 @@
+"""
+Guest-program benchmarks for the VM with regression tracking against a saved baseline.
+Usage:
+    $ python bench.py                                  # run and print results
+    $ python bench.py --save-baseline                  # run and store results as baseline
+    $ python bench.py --baseline bench_baseline.json   # run and compare with baseline
+    $ python bench.py --threads 8                      # thread scaling of single VM, 1..8 threads
+    $ python bench.py --warm-start                     # snapshot restore vs re-executing setup
+"""
+
+import argparse
+import io
+import json
+import sys
+import time
+import types
+import typing as tp
+from dataclasses import dataclass
+from pathlib import Path
+
+import vm
+import vm_analysis
+import vm_runner
+
+
+BASELINE_PATH = Path(__file__).with_name("bench_baseline.json")
+REGRESSION_THRESHOLD = 0.1
+
+
+@dataclass
+class Program:
+    name: str
+    text_code: str
+
+
+PROGRAMS = [
+    Program(
+        name="numeric_loops",
+        text_code=r"""
+total = 0
+for i in range(20000):
+    total += i * i % 7
+    if total > 1000000:
+        total -= 1000000
+print(total)
+""",
+    ),
+    Program(
+        name="recursion",
+        text_code=r"""
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+print(fib(18))
+""",
+    ),
+    Program(
+        name="string_building",
+        text_code=r"""
+parts = []
+for i in range(5000):
+    parts.append(str(i))
+joined = ",".join(parts)
+out = ""
+for i in range(3000):
+    out += chr(97 + i % 26)
+print(len(joined), out[-10:])
+""",
+    ),
+    Program(
+        name="class_heavy",
+        text_code=r"""
+class Vector:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def add(self, other):
+        return Vector(self.x + other.x, self.y + other.y)
+
+v = Vector(0, 0)
+for i in range(3000):
+    v = v.add(Vector(i, -2 * i))
+print(v.x, v.y)
+""",
+    ),
+    Program(
+        name="generator_pipeline",
+        text_code=r"""
+def numbers(n):
+    for i in range(n):
+        yield i
+
+def squares(it):
+    for x in it:
+        yield x * x
+
+def evens(it):
+    for x in it:
+        if x % 2 == 0:
+            yield x
+
+print(sum(evens(squares(numbers(10000)))))
+""",
+    ),
+    Program(
+        name="exception_heavy",
+        text_code=r"""
+def check(i):
+    if i % 3 == 0:
+        raise ValueError(i)
+    return i
+
+caught = 0
+for i in range(3000):
+    try:
+        check(i)
+    except ValueError:
+        caught += 1
+    finally:
+        caught += 0
+print(caught)
+""",
+    ),
+]
+
+
+WARM_START_SETUP = Program(
+    name="warm_start_setup",
+    text_code=r"""
+import math
+
+squares = {}
+for i in range(20000):
+    squares[i] = i * i
+roots = [math.sqrt(i) for i in range(5000)]
+
+def lookup(i):
+    return squares[i] + roots[i % 5000]
+""",
+)
+
+WARM_START_MAIN = Program(
+    name="warm_start_main",
+    text_code=r"""
+print(lookup(123), lookup(4567))
+""",
+)
+
+
+def measure_warm_start(
+    setup: Program = WARM_START_SETUP, main: Program = WARM_START_MAIN, repeat: int = 3
+) -> dict[str, tp.Any]:
+    """
+    Compare starting main phase from snapshot with re-executing setup phase on the VM
+    :param setup: expensive module-level setup
+    :param main: cheap main phase using names defined by setup
+    :param repeat: number of runs, minimal time is taken
+    :return: json-serializable result
+    """
+    setup_code = vm_analysis.analyze(setup.text_code).code
+    main_code = vm_analysis.analyze(main.text_code).code
+    machine = vm.VirtualMachine()
+
+    def run_cold() -> dict[str, tp.Any]:
+        globals_context: dict[str, tp.Any] = {}
+        machine.run(setup_code, globals_context=globals_context)
+        return globals_context
+
+    try:
+        snapshot = machine.snapshot(run_cold())
+        cold_out, _, cold_exc = vm_runner.execute(main_code, machine.run, False, run_cold())
+        warm_out, _, warm_exc = vm_runner.execute(main_code, machine.run, False, machine.restore(snapshot))
+    except Exception as e:
+        return {"error": type(e).__name__}
+    if cold_exc is not None or warm_exc is not None or cold_out != warm_out:
+        return {"error": "wrong output"}
+
+    setup_seconds = _best_time(run_cold, repeat)
+    restore_seconds = _best_time(lambda: machine.restore(snapshot), repeat)
+    return {
+        "error": None,
+        "snapshot_bytes": len(snapshot),
+        "setup_seconds": setup_seconds,
+        "restore_seconds": restore_seconds,
+        "speedup": setup_seconds / restore_seconds,
+    }
+
+
+def count_ops(code: types.CodeType) -> int:
+    """
+    Count bytecode instructions CPython executes for guest code, used as VM-independent work measure
+    :param code: compiled guest program
+    :return: number of executed guest instructions
+    """
+    ops = 0
+
+    def tracer(frame: types.FrameType, event: str, arg: tp.Any) -> tp.Any:
+        nonlocal ops
+        if frame.f_code.co_filename != code.co_filename:
+            return None
+        frame.f_trace_opcodes = True
+        if event == "opcode":
+            ops += 1
+        return tracer
+
+    globals_context: dict[str, tp.Any] = {}
+    with vm_runner.redirected(out=io.StringIO(), err=io.StringIO()):
+        sys.settrace(tracer)
+        try:
+            exec(code, globals_context, globals_context)
+        finally:
+            sys.settrace(None)
+    return ops
+
+
+def _best_time(run: tp.Callable[[], tp.Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_program(program: Program, repeat: int = 3) -> dict[str, tp.Any]:
+    """
+    Benchmark single guest program on the VM and on CPython
+    :param program: guest program to run
+    :param repeat: number of runs, minimal time is taken
+    :return: json-serializable result
+    """
+    code = vm_analysis.analyze(program.text_code).code
+
+    globals_context: dict[str, tp.Any] = {}
+    py_out, _, py_exc = vm_runner.execute(code, eval, globals_context, globals_context)
+    vm_out, _, vm_exc = vm_runner.execute(code, vm.VirtualMachine().run)
+    if vm_exc is not None or vm_out != py_out or py_exc is not None:
+        error = "wrong output" if vm_exc is None else vm_exc.__name__
+        return {"error": error}
+
+    def run_vm() -> None:
+        vm_runner.execute(code, vm.VirtualMachine().run)
+
+    def run_cpython() -> None:
+        globals_context: dict[str, tp.Any] = {}
+        vm_runner.execute(code, eval, globals_context, globals_context)
+
+    ops = count_ops(code)
+    vm_seconds = _best_time(run_vm, repeat)
+    cpython_seconds = _best_time(run_cpython, repeat)
+    return {
+        "error": None,
+        "ops": ops,
+        "vm_seconds": vm_seconds,
+        "cpython_seconds": cpython_seconds,
+        "ops_per_sec": ops / vm_seconds,
+        "ratio": vm_seconds / cpython_seconds,
+    }
+
+
+def run_all(programs: list[Program], repeat: int = 3) -> dict[str, tp.Any]:
+    return {
+        "python": sys.version.split(" ", maxsplit=1)[0],
+        "results": {program.name: run_program(program, repeat) for program in programs},
+    }
+
+
+def run_scaling(programs: list[Program], max_threads: int, jobs_per_thread: int = 2) -> list[dict[str, float]]:
+    """
+    Measure throughput of one VirtualMachine running independent guest programs on 1..max_threads threads
+    :param programs: guest programs, only ones passing on the VM are used
+    :param max_threads: maximal number of threads
+    :param jobs_per_thread: programs each thread runs
+    :return: throughput and speedup for each number of threads
+    """
+    codes = []
+    for program in programs:
+        code = vm_analysis.analyze(program.text_code).code
+        if vm_runner.execute(code, vm.VirtualMachine().run)[2] is None:
+            codes.append(code)
+    if not codes:
+        return []
+
+    machine = vm.VirtualMachine()
+    scaling = []
+    for threads in range(1, max_threads + 1):
+        jobs = [codes[i % len(codes)] for i in range(threads * jobs_per_thread)]
+        with vm_runner.redirected(out=io.StringIO(), err=io.StringIO()):
+            start = time.perf_counter()
+            machine.run_many(jobs, threads)
+            seconds = time.perf_counter() - start
+        throughput = len(jobs) / seconds
+        scaling.append({
+            "threads": threads,
+            "programs_per_sec": throughput,
+            "speedup": throughput / scaling[0]["programs_per_sec"] if scaling else 1.0,
+        })
+    return scaling
+
+
+def compare(
+    current: dict[str, tp.Any], baseline: dict[str, tp.Any], threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    """
+    Find programs which became slower than baseline by more than threshold.
+    Slowdown is measured on VM/CPython ratio, so baselines survive moving to another machine
+    :param current: results of current run
+    :param baseline: previously saved results
+    :param threshold: allowed relative slowdown
+    :return: human-readable regressions
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        result = current["results"].get(name)
+        if result is None or base.get("error") is not None:
+            continue
+        if result["error"] is not None:
+            regressions.append(f"{name}: was passing, now fails with {result['error']}")
+        elif result["ratio"] > base["ratio"] * (1 + threshold):
+            regressions.append(f"{name}: ratio {base['ratio']:.1f}x -> {result['ratio']:.1f}x")
+    return regressions
+
+
+def format_results(results: dict[str, tp.Any]) -> str:
+    lines = ["{:<20} {:>12} {:>14} {:>10}".format("program", "vm time, s", "ops/sec", "vm/py")]
+    for name, result in results["results"].items():
+        if result["error"] is not None:
+            lines.append("{:<20} {:>12}".format(name, result["error"]))
+        else:
+            lines.append("{:<20} {:>12.4f} {:>14.0f} {:>9.1f}x".format(
+                name, result["vm_seconds"], result["ops_per_sec"], result["ratio"]
+            ))
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="names", nargs="*", help="run only programs with these names")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per program, minimal time is taken")
+    parser.add_argument("--output", type=Path, help="write results as json")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed relative slowdown")
+    parser.add_argument("--threads", type=int, help="measure thread scaling of single VM up to this many threads")
+    parser.add_argument("--warm-start", action="store_true", help="measure snapshot restore against setup re-run")
+    args = parser.parse_args()
+
+    if args.warm_start:
+        result = measure_warm_start(repeat=args.repeat)
+        if result["error"] is not None:
+            print("warm start: {}".format(result["error"]))
+        else:
+            print("setup re-run {:.4f}s, restore {:.4f}s ({} bytes), speedup {:.1f}x".format(
+                result["setup_seconds"], result["restore_seconds"], result["snapshot_bytes"], result["speedup"]
+            ))
+        return 0
+
+    programs = [program for program in PROGRAMS if not args.names or program.name in args.names]
+    if args.threads is not None:
+        gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+        print("GIL is {}".format("enabled" if gil else "disabled"))
+        for row in run_scaling(programs, args.threads):
+            print("{:>3} threads: {:>10.1f} programs/sec, speedup {:.2f}x".format(
+                row["threads"], row["programs_per_sec"], row["speedup"]
+            ))
+        return 0
+
+    results = run_all(programs, args.repeat)
+    print(format_results(results))
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=4), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=4), encoding="utf-8")
+        return 0
+
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print("\nRegressions against {}:\n\t{}".format(args.baseline, "\n\t".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
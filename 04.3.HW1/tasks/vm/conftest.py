@@ -1,7 +1,99 @@
+import csv
+import json
+import statistics
+import sys
+import typing as tp
+from pathlib import Path
+
 from _pytest.terminal import TerminalReporter, WarningReport
 import pytest
 
 
+VM_RESULTS_KEY = pytest.StashKey[list[dict[str, tp.Any]]]()
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--update-cycle-budgets",
+        action="store_true",
+        default=False,
+        help="record VM cycles of passing cases as new budgets for test_cycles.py",
+    )
+    parser.addoption(
+        "--vm-reference-cache",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help="reuse CPython reference results stored in this file for local runs; "
+             "keep it outside the task directory, graded runs must not use it",
+    )
+    parser.addoption(
+        "--vm-streaming",
+        action="store_true",
+        default=False,
+        help="compare outputs chunk by chunk in bounded memory instead of capturing them whole",
+    )
+    parser.addoption(
+        "--vm-results",
+        type=Path,
+        default=None,
+        help="write per-case results and summary score of test_public.py as json to this path",
+    )
+    parser.addoption(
+        "--vm-timings",
+        type=int,
+        default=0,
+        metavar="N",
+        help="time VM against CPython on each case and report N slowest cases and VM/CPython ratios",
+    )
+    parser.addoption(
+        "--vm-timings-csv",
+        type=Path,
+        default=None,
+        help="write per-case VM and CPython timings as csv to this path",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.stash[VM_RESULTS_KEY] = []
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item: pytest.Item) -> tp.Generator[None, tp.Any, None]:
+    """Collecting results of cases reporting their score with `record_property`"""
+    outcome = yield
+    report: pytest.TestReport = outcome.get_result()
+    properties = dict(report.user_properties)
+    # Score is recorded by test body, so cases failed at setup are never reported
+    if report.when != "call" or "score" not in properties:
+        return
+    # Case names repeat, node id is the unique key
+    item.config.stash[VM_RESULTS_KEY].append({
+        "name": report.nodeid,
+        "case": properties.get("case"),
+        "passed": report.passed,
+        "score": properties["score"],
+        "duration": report.duration,
+        **{key: properties[key] for key in ("vm_seconds", "py_seconds") if key in properties},
+    })
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    path = session.config.getoption("vm_results")
+    if path is None:
+        return
+    import vm_scorer
+
+    cases = session.config.stash[VM_RESULTS_KEY]
+    results = {
+        "python": sys.version.split(" ", maxsplit=1)[0],
+        "score": sum(case["score"] for case in cases if case["passed"]),
+        "full_score": vm_scorer.FULL_SCORE,
+        "cases": cases,
+    }
+    path.write_text(json.dumps(results, indent=4), encoding="utf-8")
+
+
 @pytest.hookimpl(tryfirst=True)
 def pytest_terminal_summary(terminalreporter: TerminalReporter) -> None:
     """Adding custom section in pytest summary"""
@@ -24,3 +116,50 @@ def pytest_terminal_summary(terminalreporter: TerminalReporter) -> None:
     terminalreporter.write("".join(teardown_summaries))
     terminalreporter.currentfspath = 1
     terminalreporter.ensure_newline()
+
+    _write_timings_report(terminalreporter)
+
+
+RATIO_BUCKETS = [10, 30, 100, 300]
+
+
+def _write_timings_report(terminalreporter: TerminalReporter) -> None:
+    config = terminalreporter.config
+    slowest, csv_path = config.getoption("vm_timings"), config.getoption("vm_timings_csv")
+    cases = [
+        {**case, "ratio": case["vm_seconds"] / case["py_seconds"] if case["py_seconds"] > 0 else float("inf")}
+        for case in config.stash[VM_RESULTS_KEY] if "py_seconds" in case
+    ]
+    if not cases or (not slowest and csv_path is None):
+        return
+
+    if csv_path is not None:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["name", "case", "passed", "vm_seconds", "py_seconds", "ratio"])
+            writer.writeheader()
+            for case in cases:
+                writer.writerow({field: case[field] for field in writer.fieldnames})
+
+    if not slowest:
+        return
+    terminalreporter.section("vm timings")
+    terminalreporter.write_line("{:<40} {:>12} {:>12} {:>10}".format("case", "vm, s", "cpython, s", "vm/py"))
+    for case in sorted(cases, key=lambda case: case["vm_seconds"], reverse=True)[:slowest]:
+        terminalreporter.write_line("{:<40} {:>12.4f} {:>12.4f} {:>9.1f}x{}".format(
+            (case["case"] or case["name"])[:40], case["vm_seconds"], case["py_seconds"], case["ratio"],
+            "" if case["passed"] else "  (failed)",
+        ))
+
+    ratios = sorted(case["ratio"] for case in cases)
+    quantiles = statistics.quantiles(ratios, n=10) if len(ratios) > 1 else ratios * 9
+    terminalreporter.write_line("")
+    terminalreporter.write_line(
+        "VM/CPython ratio over {} cases: min {:.1f}x, median {:.1f}x, p90 {:.1f}x, max {:.1f}x".format(
+            len(ratios), ratios[0], statistics.median(ratios), quantiles[-1], ratios[-1]
+        )
+    )
+    bounds = [0, *RATIO_BUCKETS, float("inf")]
+    for low, high in zip(bounds, bounds[1:]):
+        count = sum(low <= ratio < high for ratio in ratios)
+        label = "{:>4}x+".format(low) if high == float("inf") else "{:>4}x-{}x".format(low, high)
+        terminalreporter.write_line("{:<12} {:>5} {}".format(label, count, "#" * (count * 50 // len(ratios))))
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import sys
+import typing as tp
+from pathlib import Path
+
+import pytest
+
+# pls don't use `inspect` and `FunctionType`
+import function_type_ban  # noqa
+import cases  # noqa
+import vm_runner  # noqa
+
+sys.modules["inspect"] = None  # type: ignore # noqa
+
+import vm  # noqa
+
+
+BUDGETS_PATH = Path(__file__).with_name("cycle_budgets.json")
+CYCLES_REGRESSION_THRESHOLD = 0.05
+
+IDS = [test.name for test in cases.TEST_CASES]
+
+
+def budget_key(test: cases.Case) -> str:
+    # Case names are not unique, code hash tells apart cases sharing a name
+    return f"{test.name}:{hashlib.sha256(test.text_code.encode()).hexdigest()[:12]}"
+
+
+@pytest.fixture(scope="module")
+def cycle_budgets(request: pytest.FixtureRequest) -> tp.Generator[dict[str, int], None, None]:
+    update = request.config.getoption("update_cycle_budgets")
+    if not BUDGETS_PATH.exists() and not update:
+        pytest.skip("No cycle budgets recorded, run `pytest test_cycles.py --update-cycle-budgets` first")
+
+    budgets: dict[str, int] = json.loads(BUDGETS_PATH.read_text(encoding="utf-8")) if BUDGETS_PATH.exists() else {}
+    yield budgets
+    if update:
+        BUDGETS_PATH.write_text(json.dumps(budgets, indent=4, sort_keys=True), encoding="utf-8")
+
+
+@pytest.mark.parametrize("test", cases.TEST_CASES, ids=IDS)
+def test_cycles(test: cases.Case, cycle_budgets: dict[str, int], request: pytest.FixtureRequest) -> None:
+    """
+    Check that VM spends no more deterministic cycles on the case than recorded budget allows
+    :param test: test case to measure
+    """
+    code = vm_runner.compile_code(test.text_code)
+    cost_model = vm.CostModel()
+    vm_out, vm_err, vm_exc = vm_runner.execute(code, vm.VirtualMachine(cost_model=cost_model).run)
+    py_out, py_err, py_exc = vm_runner.execute_reference(test.text_code, code)
+    if vm_out != py_out or vm_exc != py_exc:
+        pytest.skip("Case is not passing, correctness is checked in test_public.py")
+
+    if request.config.getoption("update_cycle_budgets"):
+        cycle_budgets[budget_key(test)] = cost_model.cycles
+        return
+
+    budget = cycle_budgets.get(budget_key(test))
+    if budget is None:
+        pytest.skip("No cycle budget recorded for the case")
+    assert cost_model.cycles <= budget * (1 + CYCLES_REGRESSION_THRESHOLD), \
+        f"VM cycles regressed: {cost_model.cycles} > {budget} (+{CYCLES_REGRESSION_THRESHOLD:.0%})"
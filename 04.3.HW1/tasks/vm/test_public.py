@@ -1,4 +1,5 @@
 import sys
+import time
 import typing as tp
 
 import pytest
@@ -71,27 +72,70 @@ def task_scorer() -> tp.Generator[Scorer, None, None]:
     print(scorer)
 
 
+@pytest.fixture(scope="module")
+def reference_cache(request: pytest.FixtureRequest) -> tp.Generator[vm_runner.ReferenceCache | None, None, None]:
+    # Opt-in only: graded runs always execute the reference
+    path = request.config.getoption("vm_reference_cache")
+    if path is None:
+        yield None
+        return
+    cache = vm_runner.ReferenceCache(path)
+    yield cache
+    cache.save()
+
+
 @pytest.mark.parametrize("test,score", zip(cases.TEST_CASES, SCORES), ids=IDS)
-def test_all_cases(test: cases.Case, score: float, task_scorer: Scorer) -> None:
+def test_all_cases(
+    test: cases.Case,
+    score: float,
+    task_scorer: Scorer,
+    reference_cache: vm_runner.ReferenceCache | None,
+    request: pytest.FixtureRequest,
+    record_property: tp.Callable[[str, tp.Any], None],
+) -> None:
     """
-    Compare all test cases with reference solution
+    Compare all test cases with reference solution.
+    Disassembly is printed only for failed cases or with `-vv`
     :param test: test case to check
     :param score: score for test if passed
     """
     # Add score to total in scorer
     # task_scorer.add_total(score)
-
-    code = vm_runner.compile_code(test.text_code)
-    globals_context: dict[str, tp.Any] = {}
-    vm_out, vm_err, vm_exc = vm_runner.execute(code, vm.VirtualMachine().run)
-    py_out, py_err, py_exc = vm_runner.execute(code, eval, globals_context, globals_context)
-
-    assert vm_out == py_out
-
-    if py_exc is not None:
-        assert vm_exc == py_exc
+    record_property("case", test.name)
+    record_property("score", score)
+
+    verbose = request.config.getoption("verbose") > 1
+    code = vm_runner.compile_code(test.text_code, verbose=verbose)
+    streaming = request.config.getoption("vm_streaming")
+    if streaming:
+        comparison = vm_runner.compare_streaming(code, vm.VirtualMachine().run)
+        vm_exc, py_exc = comparison.vm_exc, comparison.py_exc
     else:
-        assert vm_exc is None
+        start = time.perf_counter()
+        vm_out, vm_err, vm_exc = vm_runner.execute(code, vm.VirtualMachine().run)
+        record_property("vm_seconds", time.perf_counter() - start)
+        py_out, py_err, py_exc = vm_runner.execute_reference(test.text_code, code, reference_cache)
+        if request.config.getoption("vm_timings") or request.config.getoption("vm_timings_csv") is not None:
+            # Reference cache would hide CPython time, so it is measured on a separate run
+            globals_context: dict[str, tp.Any] = {}
+            start = time.perf_counter()
+            vm_runner.execute(code, eval, globals_context, globals_context)
+            record_property("py_seconds", time.perf_counter() - start)
+
+    try:
+        if streaming:
+            assert comparison.equal, str(comparison)
+        else:
+            assert vm_out == py_out
+
+        if py_exc is not None:
+            assert vm_exc == py_exc
+        else:
+            assert vm_exc is None
+    except AssertionError:
+        if not verbose:
+            print(vm_runner.disassemble(test.text_code))
+        raise
 
     # Write score into scorer
     task_scorer.add_score(score)
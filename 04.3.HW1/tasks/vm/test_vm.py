@@ -0,0 +1,242 @@
+import dis
+import importlib
+import io
+import sys
+import types
+import typing as tp
+
+import pytest
+
+# pls don't use `inspect` and `FunctionType`
+import function_type_ban  # noqa
+import vm_runner  # noqa
+
+sys.modules["inspect"] = None  # type: ignore # noqa
+
+import vm  # noqa
+
+
+def test_run_many_captures_output_per_program() -> None:
+    codes = [
+        vm_runner.compile_code("for i in range(200):\n    print({}, i)\n".format(k))
+        for k in range(6)
+    ]
+    host_stdout = io.StringIO()
+    with vm_runner.redirected(out=host_stdout):
+        results = vm.VirtualMachine().run_many(codes, threads=3)
+        assert sys.stdout is host_stdout
+
+    assert [output for _, output in results] == [
+        "".join("{} {}\n".format(k, i) for i in range(200)) for k in range(6)
+    ]
+    assert host_stdout.getvalue() == ""
+
+
+def test_run_in_executor_captures_output_per_program(monkeypatch: pytest.MonkeyPatch) -> None:
+    # asyncio imports `inspect`, the ban is lifted for the host side of this test only
+    monkeypatch.delitem(sys.modules, "inspect")
+    asyncio = importlib.import_module("asyncio")
+    machine = vm.VirtualMachine()
+    codes = [vm_runner.compile_code("for i in range(200):\n    print({}, i)\n".format(k)) for k in range(4)]
+
+    async def run_all() -> list[tuple[tp.Any, str]]:
+        return await asyncio.gather(*(machine.run_in_executor(code) for code in codes))
+
+    host_stdout = io.StringIO()
+    with vm_runner.redirected(out=host_stdout):
+        results = asyncio.run(run_all())
+        assert sys.stdout is host_stdout
+
+    assert [output for _, output in results] == [
+        "".join("{} {}\n".format(k, i) for i in range(200)) for k in range(4)
+    ]
+    assert host_stdout.getvalue() == ""
+
+
+def _assemble(*instructions: tuple[str, int]) -> types.CodeType:
+    code = bytes(byte for name, arg in instructions for byte in (dis.opmap[name], arg))
+    return compile("pass", "<malformed>", "exec").replace(co_code=code, co_linetable=b"", co_exceptiontable=b"")
+
+
+MALFORMED = {
+    "bad_jump_target": (_assemble(("RESUME", 0), ("JUMP_FORWARD", 100), ("RETURN_CONST", 0)), "bad jump target"),
+    "stack_underflow": (_assemble(("RESUME", 0), ("POP_TOP", 0), ("RETURN_CONST", 0)), "stack underflow"),
+    "falls_off_end": (_assemble(("RESUME", 0), ("NOP", 0)), "falls off the end"),
+}
+
+
+@pytest.mark.parametrize("code,message", MALFORMED.values(), ids=list(MALFORMED))
+def test_verification_rejects_malformed_code(code: types.CodeType, message: str) -> None:
+    with pytest.raises(vm.BytecodeVerificationError, match=message):
+        vm.VirtualMachine(verify=True).run(code)
+
+
+def test_verification_rejects_malformed_nested_code_before_run() -> None:
+    malformed = MALFORMED["stack_underflow"][0]
+    code = vm_runner.compile_code("print('side effect')\n")
+    code = code.replace(co_consts=(*code.co_consts, malformed))
+    stdout = io.StringIO()
+    with vm_runner.redirected(out=stdout), pytest.raises(vm.BytecodeVerificationError):
+        vm.VirtualMachine(verify=True).run(code)
+    assert stdout.getvalue() == ""
+
+
+def test_verification_accepts_valid_code() -> None:
+    code = vm_runner.compile_code("def f(n):\n    return [i * i for i in range(n) if i % 2]\nprint(f(10))\n")
+    out, err, exc = vm_runner.execute(code, vm.VirtualMachine(verify=True).run)
+    assert exc is None, err
+    assert out == "[1, 9, 25, 49, 81]\n"
+
+
+SNAPSHOT_SETUP = """
+def scale(x, factor):
+    return x * factor
+
+class Counter:
+    step = 2
+
+    def __init__(self, start):
+        self.value = start
+
+    def bump(self):
+        self.value += self.step
+        return scale(self.value, 3)
+
+counter = Counter(5)
+table = {"squares": [i * i for i in range(5)]}
+"""
+
+SNAPSHOT_USE = """
+print(scale(2, 3), scale(2, factor=10))
+print(counter.bump(), counter.bump(), Counter(1).bump())
+print(type(counter).__name__, isinstance(counter, Counter), table)
+"""
+
+
+def test_snapshot_round_trip() -> None:
+    machine = vm.VirtualMachine()
+    namespace: dict[str, tp.Any] = {}
+    with vm_runner.redirected(out=io.StringIO()):
+        machine.run(vm_runner.compile_code(SNAPSHOT_SETUP), globals_context=namespace)
+    snapshot = machine.snapshot(namespace)
+
+    outputs = []
+    for _ in range(2):
+        restored = vm.VirtualMachine().restore(snapshot)
+        out, err, exc = vm_runner.execute(
+            vm_runner.compile_code(SNAPSHOT_USE), vm.VirtualMachine().run, False, restored
+        )
+        assert exc is None, err
+        outputs.append(out)
+
+    # Every restore starts from the snapshot state, mutations of one copy do not leak into another
+    assert outputs[0] == outputs[1] == "6 20\n21 27 9\nCounter True {'squares': [0, 1, 4, 9, 16]}\n"
+    assert namespace["counter"].value == 5
+
+
+MEMORY_CALLS = 2000
+MEMORY_PROGRAM = """
+def f(n):
+    return n
+
+xs = []
+for i in range(2000):
+    x = f(i)
+    xs.append([0] * 100)
+"""
+
+
+def test_memory_report_separates_vm_allocations() -> None:
+    machine = vm.VirtualMachine()
+    machine.run(vm_runner.compile_code(MEMORY_PROGRAM), track_memory=True)
+    report = machine.memory_report
+    assert report is not None
+
+    # Every appended list plus amortized growth of `xs`
+    list_bytes = sys.getsizeof([0] * 100)
+    assert list_bytes * MEMORY_CALLS <= report.line_allocations[8] < (list_bytes + 64) * MEMORY_CALLS
+    # Frames, locals copies and argument binding of calls are not charged to calling and returning lines
+    assert abs(report.line_allocations[7]) < 128 * MEMORY_CALLS
+    assert abs(report.line_allocations[3]) < 8 * MEMORY_CALLS
+    assert report.vm_allocations > 0
+
+
+STAR_MODULE = "vm_star_module"
+
+
+def _star_module(**attrs: tp.Any) -> types.ModuleType:
+    module = types.ModuleType(STAR_MODULE)
+    vars(module).update(attrs)
+    return module
+
+
+def _run_star_import(machine: vm.VirtualMachine, source: str) -> tuple[str, tp.Any]:
+    code = vm_runner.compile_code(f"from {STAR_MODULE} import *\n{source}")
+    out, err, exc = vm_runner.execute(code, machine.run)
+    return out, exc
+
+
+def test_star_import_follows_sys_modules(monkeypatch: pytest.MonkeyPatch) -> None:
+    machine = vm.VirtualMachine()
+    monkeypatch.setitem(sys.modules, STAR_MODULE, _star_module(x=1, _hidden=2))
+    assert _run_star_import(machine, "print(x, '_hidden' in globals())\n") == ("1 False\n", None)
+
+    monkeypatch.setitem(sys.modules, STAR_MODULE, _star_module(x=3, __all__=["_hidden"], _hidden=4))
+    assert _run_star_import(machine, "print(_hidden, 'x' in globals())\n") == ("4 False\n", None)
+
+    monkeypatch.delitem(sys.modules, STAR_MODULE)
+    assert _run_star_import(machine, "print(x)\n") == ("", ModuleNotFoundError)
+
+
+def test_star_import_follows_module_attributes(monkeypatch: pytest.MonkeyPatch) -> None:
+    machine = vm.VirtualMachine()
+    module = _star_module(x=1)
+    monkeypatch.setitem(sys.modules, STAR_MODULE, module)
+    assert _run_star_import(machine, "print(x)\n") == ("1\n", None)
+
+    del module.x
+    module.y = 2
+    assert _run_star_import(machine, "print(y, 'x' in globals())\n") == ("2 False\n", None)
+
+    module.y = 5
+    assert _run_star_import(machine, "print(y)\n") == ("5\n", None)
+
+
+TAIL_CALLS = """
+import math
+
+def fact(n, acc):
+    if n <= 1:
+        return acc
+    return fact(n - 1, acc * n)
+
+print(fact(3000, 1) == math.factorial(3000))
+"""
+
+REBOUND_GLOBAL = """
+def f(n):
+    if n == 0:
+        return "old"
+    return f(n - 1)
+
+g = f
+
+def f(n):
+    return "new"
+
+print(g(2), f(2))
+"""
+
+
+def test_self_tail_call_runs_beyond_recursion_limit() -> None:
+    assert 3000 > sys.getrecursionlimit()
+    out, err, exc = vm_runner.execute(vm_runner.compile_code(TAIL_CALLS), vm.VirtualMachine().run)
+    assert exc is None, err
+    assert out == "True\n"
+
+
+def test_rebound_global_is_not_tail_called() -> None:
+    # Old body calls `f` which now names another function, frame of the old one must not be reused
+    out, err, exc = vm_runner.execute(vm_runner.compile_code(REBOUND_GLOBAL), vm.VirtualMachine().run)
+    assert exc is None, err
+    assert out == "new new\n"
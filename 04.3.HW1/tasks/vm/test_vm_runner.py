@@ -0,0 +1,91 @@
+import sys
+import types
+import typing as tp
+
+import pytest
+
+import vm_runner
+
+
+REFERENCE = "0123456789abcdefghij"
+CHUNK_SIZE = 8
+
+
+def _reference_code() -> types.CodeType:
+    return compile("import sys\nsys.stdout.write({!r})\n".format(REFERENCE), "<reference>", "exec")
+
+
+def _printing(text: str) -> tp.Callable[[types.CodeType], None]:
+    def run(code: types.CodeType) -> None:
+        sys.stdout.write(text)
+    return run
+
+
+def test_write_returns_written_length() -> None:
+    digest = vm_runner.OutputDigest(CHUNK_SIZE)
+    assert digest.write("abc") == 3
+    assert digest.write("x" * 20) == 20
+    assert digest.size == 23
+
+
+def test_equal() -> None:
+    comparison = vm_runner.compare_streaming(_reference_code(), _printing(REFERENCE), chunk_size=CHUNK_SIZE)
+    assert comparison.equal
+    assert comparison.vm_size == comparison.py_size == len(REFERENCE)
+
+
+@pytest.mark.parametrize("offset", [0, 3, CHUNK_SIZE, CHUNK_SIZE + 5, len(REFERENCE) - 1])
+def test_mismatch_inside_chunk(offset: int) -> None:
+    vm_output = REFERENCE[:offset] + "#" + REFERENCE[offset + 1:]
+    comparison = vm_runner.compare_streaming(_reference_code(), _printing(vm_output), chunk_size=CHUNK_SIZE)
+    assert not comparison.equal
+    assert comparison.mismatch_offset == offset
+    assert "#" in comparison.vm_window
+    assert REFERENCE[offset] in comparison.py_window
+
+
+@pytest.mark.parametrize("length", [0, 5, CHUNK_SIZE, 2 * CHUNK_SIZE, len(REFERENCE) - 1])
+def test_vm_output_shorter(length: int) -> None:
+    comparison = vm_runner.compare_streaming(
+        _reference_code(), _printing(REFERENCE[:length]), chunk_size=CHUNK_SIZE
+    )
+    assert not comparison.equal
+    assert comparison.mismatch_offset == length
+    assert comparison.vm_size == length
+    assert comparison.py_size == len(REFERENCE)
+
+
+@pytest.mark.parametrize("extra", ["!", "!" * (CHUNK_SIZE - len(REFERENCE) % CHUNK_SIZE), "!" * 3 * CHUNK_SIZE])
+def test_vm_output_longer(extra: str) -> None:
+    comparison = vm_runner.compare_streaming(
+        _reference_code(), _printing(REFERENCE + extra), chunk_size=CHUNK_SIZE
+    )
+    assert not comparison.equal
+    assert comparison.mismatch_offset == len(REFERENCE)
+    assert comparison.vm_size == len(REFERENCE) + len(extra)
+    assert comparison.vm_window.endswith("!")
+
+
+def test_stderr_is_not_kept() -> None:
+    def run(code: types.CodeType) -> None:
+        sys.stderr.write("e" * 100 * CHUNK_SIZE)
+        sys.stdout.write(REFERENCE)
+
+    comparison = vm_runner.compare_streaming(_reference_code(), run, chunk_size=CHUNK_SIZE)
+    assert comparison.equal
+
+
+def test_exceptions_are_reported(capsys: pytest.CaptureFixture[str]) -> None:
+    def run(code: types.CodeType) -> None:
+        sys.stdout.write(REFERENCE)
+        sys.stderr.write("guest stderr")
+        raise ValueError("vm failure")
+
+    comparison = vm_runner.compare_streaming(_reference_code(), run, chunk_size=CHUNK_SIZE)
+    assert comparison.equal
+    assert comparison.vm_exc is ValueError
+    assert comparison.py_exc is None
+
+    err = capsys.readouterr().err
+    assert "Traceback" in err and "ValueError: vm failure" in err
+    assert "guest stderr" not in err
@@ -3,11 +3,375 @@ Simplified VM code which works for some cases.
 You need extend/rewrite code to pass all cases.
 """
 
+import array
 import builtins
+import contextlib
+import copy
 import dis
+import importlib
+import io
+import marshal
+import pickle
 import types
 import typing as tp
 import operator
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CostModel:
+    """
+    Deterministic virtual-cycle counter for noise-free performance checks.
+    Cycles are weighted counts of executed instructions by opcode class, guest calls and allocations,
+    so they depend only on the executed code, not on machine load
+    """
+    OPCODE_CLASSES = (
+        "POP_JUMP", "JUMP", "LOAD", "STORE", "DELETE", "UNARY", "BINARY", "COMPARE",
+        "CALL", "BUILD", "IMPORT", "RETURN",
+    )
+    CLASS_WEIGHTS = {
+        "LOAD": 1, "STORE": 1, "DELETE": 1, "JUMP": 1, "POP_JUMP": 2, "RETURN": 1,
+        "UNARY": 2, "BINARY": 3, "COMPARE": 3, "BUILD": 2, "CALL": 5, "IMPORT": 50,
+        "OTHER": 1,
+    }
+    ALLOCATING_OPS = frozenset({
+        "BUILD_TUPLE", "BUILD_LIST", "BUILD_SET", "BUILD_MAP", "BUILD_CONST_KEY_MAP", "BUILD_STRING",
+        "BUILD_SLICE", "MAKE_FUNCTION", "LIST_APPEND", "SET_ADD", "MAP_ADD",
+    })
+    CALL_WEIGHT = 20
+    ALLOCATION_WEIGHT = 4
+
+    def __init__(self) -> None:
+        self.instructions: tp.Counter[str] = Counter()
+        self.calls = 0
+        self.allocations = 0
+        self._classes: dict[str, str] = {}
+
+    def opcode_class(self, opname: str) -> str:
+        op_class = self._classes.get(opname)
+        if op_class is None:
+            op_class = next((c for c in self.OPCODE_CLASSES if opname.startswith(c)), "OTHER")
+            self._classes[opname] = op_class
+        return op_class
+
+    def on_instruction(self, opname: str) -> None:
+        self.instructions[self.opcode_class(opname)] += 1
+        if opname in self.ALLOCATING_OPS:
+            self.allocations += 1
+
+    def on_call(self) -> None:
+        self.calls += 1
+
+    def merge(self, other: "CostModel") -> None:
+        self.instructions.update(other.instructions)
+        self.calls += other.calls
+        self.allocations += other.allocations
+
+    @property
+    def cycles(self) -> int:
+        return (
+            sum(self.CLASS_WEIGHTS[op_class] * count for op_class, count in self.instructions.items())
+            + self.CALL_WEIGHT * self.calls
+            + self.ALLOCATION_WEIGHT * self.allocations
+        )
+
+
+# Slots of MemoryReport running sums
+_TRACED, _VM_START, _VM_PENDING, _VM_BYTES = range(4)
+
+
+class MemoryReport:
+    """
+    Memory accounting of single VM run: peak frame count and value stack depth,
+    bytes of decoded instruction data per code object and tracemalloc-traced
+    allocations attributed to guest source lines.
+    Only bytes allocated while instruction handlers run are charged to guest lines; dispatch loop and
+    VM's own structures (frames, locals copies, decoded code, bracketed with `enter_vm`/`exit_vm`)
+    are counted in `vm_allocations` instead.
+    Objects recycled through CPython free lists may still move a few dozen bytes per call
+    between a calling line and VM bucket
+    """
+
+    def __init__(self) -> None:
+        self.peak_frames = 0
+        self.peak_stack_depth = 0
+        self.peak_traced_bytes = 0
+        self.code_bytes: dict[str, int] = {}
+        self.line_allocations: tp.Counter[int] = Counter()
+        self.vm_allocations = 0
+        self._frames = 0
+        # Line of instruction whose handler is running, None while VM itself runs
+        self._line: int | None = None
+        self._last_line: int | None = None
+        self._outer_lines: list[int | None] = []
+        self._vm_depth = 0
+        # Running sums live in arrays: int objects kept between measurements would be counted themselves
+        self._state = array.array("q", [tracemalloc.get_traced_memory()[0], 0, 0, 0])
+        self._line_slots: dict[int, int] = {}
+        self._line_bytes = array.array("q")
+
+    def on_frame_enter(self) -> None:
+        self._frames += 1
+        self.peak_frames = max(self.peak_frames, self._frames)
+        self._flush()
+        self._outer_lines.append(self._line)
+        self._line = None
+
+    def on_frame_exit(self) -> None:
+        self._frames -= 1
+        self._flush()
+        self._line = self._outer_lines.pop()
+
+    def on_instruction(self, frame: "Frame", inst: dis.Instruction) -> None:
+        self.peak_stack_depth = max(self.peak_stack_depth, len(frame.data_stack))
+        self._flush()
+        if inst.positions is not None and inst.positions.lineno is not None:
+            self._last_line = inst.positions.lineno
+        self._line = self._last_line
+
+    def on_instruction_end(self) -> None:
+        self._flush()
+        self._line = None
+
+    def enter_vm(self) -> None:
+        if self._vm_depth == 0:
+            self._state[_VM_START] = tracemalloc.get_traced_memory()[0]
+        self._vm_depth += 1
+
+    def exit_vm(self) -> None:
+        self._vm_depth -= 1
+        if self._vm_depth == 0:
+            allocated = tracemalloc.get_traced_memory()[0] - self._state[_VM_START]
+            self._state[_VM_BYTES] += allocated
+            self._state[_VM_PENDING] += allocated
+
+    def _flush(self) -> None:
+        # Bytes allocated since previous event go to running guest line, or to VM between instructions
+        traced = tracemalloc.get_traced_memory()[0]
+        guest = traced - self._state[_TRACED] - self._state[_VM_PENDING]
+        if self._line is None:
+            self._state[_VM_BYTES] += guest
+        else:
+            slot = self._line_slots.get(self._line)
+            if slot is None:
+                slot = self._line_slots[self._line] = len(self._line_bytes)
+                self._line_bytes.append(0)
+            self._line_bytes[slot] += guest
+        self._state[_TRACED] = traced
+        self._state[_VM_PENDING] = 0
+
+    def finish(self, code_infos: tp.Iterable["CodeInfo"]) -> None:
+        self._flush()
+        self.peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+        self.vm_allocations = self._state[_VM_BYTES]
+        self.line_allocations = Counter({line: self._line_bytes[slot] for line, slot in self._line_slots.items()})
+        for info in code_infos:
+            self.code_bytes[f"{info.code.co_name}:{info.code.co_firstlineno}"] = info.nbytes()
+
+    def __str__(self) -> str:
+        lines = [
+            f"Peak frames: {self.peak_frames}",
+            f"Peak value stack depth: {self.peak_stack_depth}",
+            f"Peak traced memory: {self.peak_traced_bytes} B",
+            f"VM structures allocations: {self.vm_allocations} B",
+            "Decoded code bytes:",
+            *(f"\t{name}: {size}" for name, size in sorted(self.code_bytes.items())),
+            "Allocations by guest line:",
+            *(f"\t{line}: {size}" for line, size in sorted(self.line_allocations.items())),
+        ]
+        return "\n".join(lines)
+
+
+class BytecodeVerificationError(RuntimeError):
+    pass
+
+
+JUMP_OPCODES = frozenset(getattr(dis, "hasjump", None) or dis.hasjrel + dis.hasjabs)
+UNCONDITIONAL_JUMPS = frozenset({
+    "JUMP_FORWARD", "JUMP_BACKWARD", "JUMP_BACKWARD_NO_INTERRUPT", "JUMP", "JUMP_NO_INTERRUPT",
+})
+TERMINATORS = frozenset({"RETURN_VALUE", "RETURN_CONST", "RAISE_VARARGS", "RERAISE"})
+BOOL_PRODUCERS = frozenset({"TO_BOOL", "IS_OP", "CONTAINS_OP", "UNARY_NOT"})
+CO_VARARGS = 4
+CO_VARKEYWORDS = 8
+# Operands of CALL_INTRINSIC_1 handled by VM
+INTRINSIC_IMPORT_STAR = 2
+INTRINSIC_UNARY_POSITIVE = 5
+INTRINSIC_LIST_TO_TUPLE = 6
+# Handlers of these opcodes take raw argument instead of resolved argval
+RAW_ARG_OPS = frozenset({
+    "LOAD_GLOBAL", "LOAD_ATTR",
+    "LOAD_FAST_LOAD_FAST", "STORE_FAST_STORE_FAST", "STORE_FAST_LOAD_FAST",
+    "SET_FUNCTION_ATTRIBUTE",
+})
+
+
+class CodeInfo:
+    """
+    Decoded instructions of code object, shared by all frames running it.
+    With verification also keeps results of static analysis: max stack depth,
+    possibly unbound locals and instructions proven safe to run without runtime checks
+    """
+
+    def __init__(self, code: types.CodeType, verify: bool = False) -> None:
+        self.code = code
+        self.instructions: list[dis.Instruction] = list(dis.get_instructions(code))
+        self.off2idx: dict[int, int] = {inst.offset: i for i, inst in enumerate(self.instructions)}
+        self.handlers: list[str] = [inst.opname.lower() + "_op" for inst in self.instructions]
+        self.max_stack_depth: int | None = None
+        self.maybe_unbound: frozenset[str] = frozenset()
+        if verify:
+            self._verify()
+
+    def nbytes(self) -> int:
+        """
+        Approximate size of decoded instruction data kept for the code object
+        """
+        size = sys.getsizeof(self.instructions) + sys.getsizeof(self.off2idx) + sys.getsizeof(self.handlers)
+        return size + sum(sys.getsizeof(inst) for inst in self.instructions)
+
+    def _error(self, inst: dis.Instruction, message: str) -> BytecodeVerificationError:
+        return BytecodeVerificationError(f"{self.code.co_name}: {inst.opname} at offset {inst.offset}: {message}")
+
+    def _successors(self, idx: int) -> list[tuple[int, bool]]:
+        """
+        Indices of instructions which may run after idx, paired with "via jump" flag
+        """
+        inst = self.instructions[idx]
+        successors = []
+        if inst.opcode in JUMP_OPCODES:
+            target = self.off2idx.get(inst.argval)
+            if target is None:
+                raise self._error(inst, f"bad jump target {inst.argval}")
+            successors.append((target, True))
+        if inst.opname not in TERMINATORS and inst.opname not in UNCONDITIONAL_JUMPS:
+            if idx + 1 >= len(self.instructions):
+                raise self._error(inst, "execution falls off the end of code")
+            successors.append((idx + 1, False))
+        return successors
+
+    def _verify(self) -> None:
+        exception_entries = dis.Bytecode(self.code).exception_entries
+        handler_depths: dict[int, int] = {}
+        for entry in exception_entries:
+            target = self.off2idx.get(entry.target)
+            if target is None:
+                raise BytecodeVerificationError(f"{self.code.co_name}: bad exception handler target {entry.target}")
+            handler_depths[target] = entry.depth + 1 + int(entry.lasti)
+
+        jump_targets = set(handler_depths)
+        for idx, inst in enumerate(self.instructions):
+            jump_targets.update(target for target, via_jump in self._successors(idx) if via_jump)
+
+        self.max_stack_depth = self._check_stack(handler_depths)
+        self.maybe_unbound = self._check_locals(exception_entries, jump_targets)
+
+        for idx in range(1, len(self.instructions)):
+            inst = self.instructions[idx]
+            if inst.opname in ("POP_JUMP_IF_TRUE", "POP_JUMP_IF_FALSE") and idx not in jump_targets:
+                prev = self.instructions[idx - 1]
+                bool_compare = prev.opname == "COMPARE_OP" and sys.version_info >= (3, 13) and prev.arg & 16
+                if prev.opname in BOOL_PRODUCERS or bool_compare:
+                    self.handlers[idx] = "_" + inst.opname.lower() + "_unchecked"
+
+    def _check_stack(self, handler_depths: dict[int, int]) -> int:
+        depths: dict[int, int] = dict(handler_depths)
+        depths.setdefault(0, 0)
+        worklist = list(depths)
+        max_depth = max(depths.values())
+
+        while worklist:
+            idx = worklist.pop()
+            inst = self.instructions[idx]
+            arg = inst.arg if inst.opcode >= dis.HAVE_ARGUMENT else None
+            for successor, via_jump in self._successors(idx):
+                try:
+                    effect = dis.stack_effect(inst.opcode, arg, jump=via_jump)
+                except ValueError as e:
+                    raise self._error(inst, str(e))
+                if inst.opname == "RETURN_GENERATOR":
+                    # Resumed generator frame starts with sent value on the stack
+                    effect = 1
+                depth = depths[idx] + effect
+                if depth < 0:
+                    raise self._error(inst, "stack underflow")
+                known = depths.get(successor)
+                if known is None:
+                    depths[successor] = depth
+                    max_depth = max(max_depth, depth)
+                    worklist.append(successor)
+                elif known != depth:
+                    raise self._error(self.instructions[successor], f"inconsistent stack depth {known} != {depth}")
+        return max_depth
+
+    def _check_locals(self, exception_entries: list[tp.Any], jump_targets: set[int]) -> frozenset[str]:
+        """
+        Forward "definitely assigned" analysis over fast locals.
+        LOAD_FAST_CHECK of definitely assigned name is switched to plain LOAD_FAST
+        """
+        code = self.code
+        nargs = code.co_argcount + code.co_kwonlyargcount
+        nargs += bool(code.co_flags & CO_VARARGS) + bool(code.co_flags & CO_VARKEYWORDS)
+        entry_state = frozenset(code.co_varnames[:nargs])
+
+        states: dict[int, frozenset[str]] = {0: entry_state}
+        worklist = [0]
+        while worklist:
+            idx = worklist.pop()
+            inst = self.instructions[idx]
+            state = self._assign(states[idx], inst)
+
+            successors = [successor for successor, _ in self._successors(idx)]
+            for entry in exception_entries:
+                if entry.start <= inst.offset < entry.end:
+                    # Handler may be entered before current instruction completes
+                    successors.append(self.off2idx[entry.target])
+                    state_before = states[idx]
+                    self._merge(states, worklist, self.off2idx[entry.target], state_before & state)
+            for successor in successors:
+                self._merge(states, worklist, successor, state)
+
+        maybe_unbound = set()
+        for idx, inst in enumerate(self.instructions):
+            if inst.opname not in ("LOAD_FAST_CHECK", "LOAD_FAST") or idx not in states:
+                continue
+            if inst.argval in states[idx]:
+                if inst.opname == "LOAD_FAST_CHECK":
+                    self.handlers[idx] = "load_fast_op"
+            else:
+                maybe_unbound.add(inst.argval)
+        return frozenset(maybe_unbound)
+
+    @staticmethod
+    def _merge(states: dict[int, frozenset[str]], worklist: list[int], idx: int, state: frozenset[str]) -> None:
+        known = states.get(idx)
+        merged = state if known is None else known & state
+        if merged != known:
+            states[idx] = merged
+            worklist.append(idx)
+
+    def _assign(self, state: frozenset[str], inst: dis.Instruction) -> frozenset[str]:
+        varnames = self.code.co_varnames
+        if inst.opname == "STORE_FAST":
+            return state | {inst.argval}
+        if inst.opname == "STORE_FAST_STORE_FAST":
+            return state | {varnames[inst.arg >> 4], varnames[inst.arg & 0x0F]}
+        if inst.opname == "STORE_FAST_LOAD_FAST":
+            return state | {varnames[inst.arg >> 4]}
+        if inst.opname in ("DELETE_FAST", "LOAD_FAST_AND_CLEAR"):
+            return state - {inst.argval}
+        return state
+
+
+class FTProxy:
+    def __init__(self, co: types.CodeType):
+        self.__code__ = co
+        self.__defaults__ = None
+        self.__kwdefaults__ = None
+        self.__annotations__ = {}
 
 
 class Frame:
@@ -15,7 +379,9 @@ class Frame:
                  frame_code: types.CodeType,
                  frame_builtins: dict[str, tp.Any],
                  frame_globals: dict[str, tp.Any],
-                 frame_locals: dict[str, tp.Any]) -> None:
+                 frame_locals: dict[str, tp.Any],
+                 vm: tp.Optional["VirtualMachine"] = None) -> None:
+        self.vm = vm
         self.code = frame_code
         self.builtins = frame_builtins
         self.globals = frame_globals
@@ -23,8 +389,15 @@ class Frame:
         self.data_stack: list[tp.Any] = []
         self.return_value = None
 
-        self.instructions: list[dis.Instruction] = list(dis.get_instructions(self.code))
-        self._off2idx: dict[int, int] = {inst.offset: i for i, inst in enumerate(self.instructions)}
+        # Set for frames of VM functions, needed to reuse frame on self tail calls
+        self.function: tp.Callable[..., tp.Any] | None = None
+        self.signature: tp.Any = None
+        self.enclosing_locals: dict[str, tp.Any] = {}
+
+        info = vm.code_info(frame_code) if vm is not None else CodeInfo(frame_code)
+        self.instructions: list[dis.Instruction] = info.instructions
+        self._off2idx: dict[int, int] = info.off2idx
+        self._handlers: list[str] = info.handlers
         self.pc: int = 0
         self.next_pc: int = 0
 
@@ -48,24 +421,35 @@ class Frame:
         return []
 
     def run(self) -> tp.Any:
-        RAW_ARG_OPS = {
-            "LOAD_GLOBAL", "LOAD_ATTR",
-            "LOAD_FAST_LOAD_FAST", "STORE_FAST_STORE_FAST", "STORE_FAST_LOAD_FAST",
-            "SET_FUNCTION_ATTRIBUTE",
-        }
-
-        while self.pc < len(self.instructions):
-            inst = self.instructions[self.pc]
-            self.next_pc = self.pc + 1
-
-            opname = inst.opname
-            if opname in RAW_ARG_OPS:
-                arg = inst.arg
-            else:
-                arg = inst.argval
+        cost_model = self.vm.cost_model if self.vm is not None else None
+        if cost_model is not None:
+            cost_model.on_call()
+        memory_report = self.vm.memory_report if self.vm is not None else None
+        if memory_report is not None:
+            memory_report.on_frame_enter()
 
-            getattr(self, opname.lower() + "_op")(arg)
-            self.pc = self.next_pc
+        try:
+            while self.pc < len(self.instructions):
+                inst = self.instructions[self.pc]
+                self.next_pc = self.pc + 1
+
+                opname = inst.opname
+                if cost_model is not None:
+                    cost_model.on_instruction(opname)
+                if memory_report is not None:
+                    memory_report.on_instruction(self, inst)
+                if opname in RAW_ARG_OPS:
+                    arg = inst.arg
+                else:
+                    arg = inst.argval
+
+                getattr(self, self._handlers[self.pc])(arg)
+                if memory_report is not None:
+                    memory_report.on_instruction_end()
+                self.pc = self.next_pc
+        finally:
+            if memory_report is not None:
+                memory_report.on_frame_exit()
 
         return self.return_value
 
@@ -83,7 +467,28 @@ class Frame:
         pass
 
     def load_build_class_op(self, arg: int) -> None:
-        self.push(builtins.__build_class__)
+        self.push(self._build_class)
+
+    def _build_class(self, func: tp.Any, name: str, *bases: tp.Any, **kwds: tp.Any) -> tp.Any:
+        """
+        __build_class__ replacement: body of VM function runs directly into class namespace,
+        without function wrapper and copy of enclosing locals
+        """
+        code = getattr(func, "_vm_code", None)
+        if code is None:
+            return builtins.__build_class__(func, name, *bases, **kwds)
+
+        resolved_bases = types.resolve_bases(bases)
+        meta, namespace, kwds = types.prepare_class(name, resolved_bases, kwds)
+        Frame(code, self.builtins, func._vm_globals, namespace, self.vm).run()
+        if resolved_bases is not bases:
+            namespace["__orig_bases__"] = bases
+
+        cell = namespace.get("__classcell__")
+        cls = meta(name, resolved_bases, namespace, **kwds)
+        if isinstance(cell, types.CellType) and isinstance(cls, type) and cell.cell_contents is not cls:
+            raise TypeError(f"__class__ set to {cell.cell_contents!r} defining {name!r} as {cls!r}")
+        return cls
 
     def pop_top_op(self, arg: tp.Any) -> None:
         self.pop()
@@ -161,10 +566,38 @@ class Frame:
         container[start:end] = values
 
     # ---------- CALL ----------
+    def _try_tail_call(self, func: tp.Any, self_or_null: tp.Any,
+                       args: list[tp.Any], kwargs: dict[str, tp.Any]) -> bool:
+        """
+        Reuse current frame when it calls its own function right before returning:
+        locals are rebound and execution restarts from the first instruction, so deep
+        tail recursion runs in constant memory
+        """
+        if func is not self.function or self_or_null is not None:
+            return False
+        if self.next_pc >= len(self.instructions) or self.instructions[self.next_pc].opname != "RETURN_VALUE":
+            return False
+
+        memory_report = self.vm.memory_report if self.vm is not None else None
+        if memory_report is not None:
+            memory_report.enter_vm()
+        try:
+            bound_locals = bind_args(self.signature, *args, **kwargs)
+            self.locals = dict(self.enclosing_locals)
+            self.locals.update(bound_locals)
+            self.data_stack.clear()
+        finally:
+            if memory_report is not None:
+                memory_report.exit_vm()
+        self.next_pc = 0
+        return True
+
     def call_op(self, argc: int) -> None:
         args = self.popn(argc)
         self_or_null = self.pop()
         func = self.pop()
+        if self._try_tail_call(func, self_or_null, args, {}):
+            return
         if self_or_null is not None:
             bound_self = getattr(func, "__self__", None)
             if bound_self is not None:
@@ -188,6 +621,8 @@ class Frame:
         self_or_null = self.pop()
         func = self.pop()
         kwargs = {k: v for k, v in zip(names, kw_values)}
+        if self._try_tail_call(func, self_or_null, pos_args, kwargs):
+            return
         if self_or_null is not None:
             bound_self = getattr(func, "__self__", None)
             if bound_self is not None:
@@ -273,9 +708,11 @@ class Frame:
 
     def return_value_op(self, arg: tp.Any) -> None:
         self.return_value = self.pop()
+        self.next_pc = len(self.instructions)
 
     def return_const_op(self, arg: tp.Any) -> None:
         self.return_value = arg
+        self.next_pc = len(self.instructions)
 
     def setup_annotations_op(self, arg: tp.Any) -> None:
         if "__annotations__" not in self.locals:
@@ -284,25 +721,55 @@ class Frame:
     # ---------- MAKE_FUNCTION + attributes ----------
     def make_function_op(self, arg: int) -> None:
         code = self.pop()
+        f = self._make_function(code, FTProxy(code))
+        f._vm_globals = self.globals  # type: ignore[attr-defined]
+        self.push(f)
 
-        class FTProxy:
-            def __init__(self, co: types.CodeType):
-                self.__code__ = co
-                self.__defaults__ = None
-                self.__kwdefaults__ = None
-                self.__annotations__ = {}
-
-        ftproxy = FTProxy(code)
-
+    def _make_function(self, code: types.CodeType, ftproxy: "FTProxy") -> tp.Callable[..., tp.Any]:
         def f(*call_args: tp.Any, **call_kwargs: tp.Any) -> tp.Any:
-            sig = ftproxy
-            bound_locals = bind_args(sig, *call_args, **call_kwargs)
-            callee_locals = dict(self.locals)
-            callee_locals.update(bound_locals)
-            frame = Frame(code, self.builtins, self.globals, callee_locals)
-            return frame.run()
-
-        self.push(f)
+            memory_report = self.vm.memory_report if self.vm is not None else None
+            if memory_report is not None:
+                memory_report.enter_vm()
+            try:
+                sig = ftproxy
+                bound_locals = bind_args(sig, *call_args, **call_kwargs)
+                callee_locals = dict(self.locals)
+                callee_locals.update(bound_locals)
+                frame = Frame(code, self.builtins, self.globals, callee_locals, self.vm)
+                frame.function = f
+                frame.signature = sig
+                frame.enclosing_locals = self.locals
+            finally:
+                if memory_report is not None:
+                    memory_report.exit_vm()
+            if memory_report is None:
+                return frame.run()
+            try:
+                return frame.run()
+            finally:
+                # Frame, its locals copy and call arguments are freed here, it is VM memory as well
+                memory_report.enter_vm()
+                del frame, callee_locals, bound_locals, call_args, call_kwargs
+                memory_report.exit_vm()
+
+        f._vm_code = code  # type: ignore[attr-defined]
+        f._vm_frame = self  # type: ignore[attr-defined]
+        f._vm_signature = ftproxy  # type: ignore[attr-defined]
+        return f
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        # Decoded instructions are rebuilt from code on restore
+        state = dict(self.__dict__)
+        for key in ("instructions", "_off2idx", "_handlers"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state: dict[str, tp.Any]) -> None:
+        self.__dict__.update(state)
+        info = self.vm.code_info(self.code) if self.vm is not None else CodeInfo(self.code)
+        self.instructions = info.instructions
+        self._off2idx = info.off2idx
+        self._handlers = info.handlers
 
     def set_function_attribute_op(self, flag: int) -> None:
         func = self.pop()
@@ -513,6 +980,14 @@ class Frame:
         if not v:
             self._jump_to_offset(target_offset)
 
+    def _pop_jump_if_true_unchecked(self, target_offset: int) -> None:
+        if self.pop():
+            self._jump_to_offset(target_offset)
+
+    def _pop_jump_if_false_unchecked(self, target_offset: int) -> None:
+        if not self.pop():
+            self._jump_to_offset(target_offset)
+
     def pop_jump_if_none_op(self, target_offset: int) -> None:
         if self.pop() is None:
             self._jump_to_offset(target_offset)
@@ -533,13 +1008,33 @@ class Frame:
 
     def import_name_op(self, namei: str) -> None:
         level, fromlist = self.popn(2)
-        self.push(__import__(namei, self.globals, self.locals, fromlist, level))
+        if self.vm is not None and level == 0:
+            self.push(self.vm.import_module(namei, fromlist, self.globals, self.locals))
+        else:
+            self.push(__import__(namei, self.globals, self.locals, fromlist, level))
 
     def import_star_op(self, arg: tp.Any) -> None:
-        mod = self.pop()
-        for attr in dir(mod):
-            if attr[0] != '_':
-                self.locals[attr] = getattr(mod, attr)
+        self._import_star(self.pop())
+
+    def call_intrinsic_1_op(self, function: int) -> None:
+        value = self.pop()
+        if function == INTRINSIC_IMPORT_STAR:
+            self._import_star(value)
+            self.push(None)
+        elif function == INTRINSIC_UNARY_POSITIVE:
+            self.push(+value)
+        elif function == INTRINSIC_LIST_TO_TUPLE:
+            self.push(tuple(value))
+        else:
+            raise NotImplementedError(f"CALL_INTRINSIC_1 {function} is not supported")
+
+    def _import_star(self, mod: tp.Any) -> None:
+        # Same names as CPython binds: `__all__` if defined, otherwise public names of module namespace
+        names = getattr(mod, "__all__", None)
+        if names is None:
+            names = [attr for attr in vars(mod) if attr[0] != '_']
+        for attr in names:
+            self.locals[attr] = getattr(mod, attr)
 
     def import_from_op(self, namei: str) -> None:
         mod = self.top()
@@ -549,11 +1044,291 @@ class Frame:
         self.push(AssertionError)
 
 
+def _is_importable(obj: tp.Any) -> bool:
+    target: tp.Any = sys.modules.get(getattr(obj, "__module__", None) or "")
+    for part in getattr(obj, "__qualname__", "").split("."):
+        target = getattr(target, part, None)
+    return target is obj
+
+
+def _restore_function(frame: Frame, code: types.CodeType, ftproxy: FTProxy) -> tp.Callable[..., tp.Any]:
+    return frame._make_function(code, ftproxy)
+
+
+def _set_function_state(func: tp.Any, state: tuple[dict[str, tp.Any], dict[str, tp.Any]]) -> None:
+    attributes, namespace = state
+    for name, value in attributes.items():
+        setattr(func, name, value)
+    func.__dict__.update(namespace)
+
+
+def _restore_class(meta: type, name: str, bases: tuple[type, ...]) -> type:
+    return meta(name, bases, {})
+
+
+def _set_class_state(cls: type, namespace: dict[str, tp.Any]) -> None:
+    for name, value in namespace.items():
+        setattr(cls, name, value)
+
+
+class SnapshotPickler(pickle.Pickler):
+    """
+    Pickler for VM heap: VM functions are rebuilt around their (pickled) defining frame,
+    guest classes are rebuilt from their namespace, code objects go through marshal,
+    modules are re-imported, builtins and the VM itself are referenced, not copied
+    """
+
+    def persistent_id(self, obj: tp.Any) -> str | None:
+        if isinstance(obj, VirtualMachine):
+            return "vm"
+        if obj is builtins.__dict__:
+            return "builtins"
+        return None
+
+    def reducer_override(self, obj: tp.Any) -> tp.Any:
+        if isinstance(obj, types.CodeType):
+            return marshal.loads, (marshal.dumps(obj),)
+        if isinstance(obj, types.ModuleType):
+            return importlib.import_module, (obj.__name__,)
+        if callable(obj) and hasattr(obj, "_vm_code") and hasattr(obj, "_vm_frame"):
+            attributes = {
+                "__defaults__": obj.__defaults__,
+                "__kwdefaults__": obj.__kwdefaults__,
+                "__annotations__": obj.__annotations__,
+            }
+            namespace = {k: v for k, v in obj.__dict__.items() if k not in ("_vm_code", "_vm_frame", "_vm_signature")}
+            args = (obj._vm_frame, obj._vm_code, obj._vm_signature)
+            return _restore_function, args, (attributes, namespace), None, None, _set_function_state
+        if isinstance(obj, type) and not _is_importable(obj):
+            namespace = {k: v for k, v in vars(obj).items() if k not in ("__dict__", "__weakref__")}
+            return _restore_class, (type(obj), obj.__name__, obj.__bases__), namespace, None, None, _set_class_state
+        return NotImplemented
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file: tp.BinaryIO, vm: "VirtualMachine") -> None:
+        super().__init__(file)
+        self._vm = vm
+
+    def persistent_load(self, pid: str) -> tp.Any:
+        if pid == "vm":
+            return self._vm
+        if pid == "builtins":
+            return builtins.__dict__
+        raise pickle.UnpicklingError(f"Unknown persistent id {pid}")
+
+
+class _ThreadStdout(io.TextIOBase):
+    """
+    Stand-in for sys.stdout sending writes of threads with their own stream there, others to the original one
+    """
+    # Stand-in shared by all concurrent captured runs, installed while any of them is running
+    _installed: tp.Optional["_ThreadStdout"] = None
+    _users = 0
+    _install_lock = threading.Lock()
+
+    def __init__(self, default: tp.TextIO) -> None:
+        self._default = default
+        self._local = threading.local()
+
+    @classmethod
+    @contextlib.contextmanager
+    def installed(cls) -> tp.Iterator["_ThreadStdout"]:
+        with cls._install_lock:
+            if cls._installed is None:
+                cls._installed = cls(sys.stdout)
+                sys.stdout = cls._installed
+            cls._users += 1
+            stdout = cls._installed
+        try:
+            yield stdout
+        finally:
+            with cls._install_lock:
+                cls._users -= 1
+                if cls._users == 0:
+                    sys.stdout = stdout._default
+                    cls._installed = None
+
+    @property
+    def stream(self) -> tp.TextIO:
+        return getattr(self._local, "stream", self._default)
+
+    @stream.setter
+    def stream(self, stream: tp.TextIO) -> None:
+        self._local.stream = stream
+
+    @stream.deleter
+    def stream(self) -> None:
+        del self._local.stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        return self.stream.write(s)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
 class VirtualMachine:
-    def run(self, code_obj: types.CodeType) -> tp.Any:
-        globals_context: dict[str, tp.Any] = {}
-        frame = Frame(code_obj, builtins.globals()['__builtins__'], globals_context, globals_context)
-        return frame.run()
+    """
+    Decoded code, import and name-table caches are shared by all runs of the VM and are safe to use
+    from several threads without locks: entries are immutable and published with single dict operations.
+    Mutable execution state lives in frames, which are never shared between threads
+    """
+
+    def __init__(self, cost_model: CostModel | None = None, verify: bool = False) -> None:
+        """
+        :param cost_model: optional counter of deterministic virtual cycles spent by guest code
+        :param verify: statically check every code object before running it,
+            proven-safe instructions then skip their runtime checks
+        """
+        self.cost_model = cost_model
+        self.verify = verify
+        self._code_infos: dict[types.CodeType, CodeInfo] = {}
+        # (name, fromlist) -> (__import__ result, sys.modules entry it was resolved from)
+        self._modules: dict[tuple[str, tp.Any], tuple[types.ModuleType, types.ModuleType | None]] = {}
+        self._cost_lock = threading.Lock()
+        self.memory_report: MemoryReport | None = None
+
+    def code_info(self, code: types.CodeType) -> CodeInfo:
+        """
+        Decoded (and optionally verified) code object, built once per VM
+        """
+        info = self._code_infos.get(code)
+        if info is None:
+            memory_report = self.memory_report
+            if memory_report is not None:
+                memory_report.enter_vm()
+            try:
+                # CodeInfo is immutable once built, concurrent builders agree on the first published one
+                info = self._code_infos.setdefault(code, CodeInfo(code, self.verify))
+            finally:
+                if memory_report is not None:
+                    memory_report.exit_vm()
+        return info
+
+    def import_module(self, name: str, fromlist: tp.Any,
+                      frame_globals: dict[str, tp.Any], frame_locals: dict[str, tp.Any]) -> tp.Any:
+        """
+        Absolute import through per-VM cache, full import machinery runs only on a miss.
+        Cached entry is valid while sys.modules still holds the same module objects
+        """
+        key = (name, fromlist)
+        cached = self._modules.get(key)
+        if cached is not None:
+            result, module = cached
+            if module is not None and sys.modules.get(name) is module \
+                    and sys.modules.get(result.__name__) is result:
+                return result
+
+        result = __import__(name, frame_globals, frame_locals, fromlist, 0)
+        if isinstance(result, types.ModuleType):
+            self._modules[key] = (result, sys.modules.get(name))
+        return result
+
+    def run(self, code_obj: types.CodeType, track_memory: bool = False,
+            globals_context: dict[str, tp.Any] | None = None) -> tp.Any:
+        """
+        :param code_obj: code to execute
+        :param track_memory: collect MemoryReport of the run into `memory_report`
+        :param globals_context: module namespace to run in, e.g. restored from `snapshot`
+        :return: value returned by code
+        """
+        if self.verify:
+            # Fail on malformed nested code before guest program makes any side effects
+            pending = [code_obj]
+            while pending:
+                code = pending.pop()
+                self.code_info(code)
+                pending.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+
+        started_tracing = False
+        self.memory_report = None
+        if track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            self.memory_report = MemoryReport()
+
+        if globals_context is None:
+            globals_context = {}
+        try:
+            frame = Frame(code_obj, builtins.globals()['__builtins__'], globals_context, globals_context, self)
+            return frame.run()
+        finally:
+            if self.memory_report is not None:
+                self.memory_report.finish(list(self._code_infos.values()))
+            if started_tracing:
+                tracemalloc.stop()
+
+    def snapshot(self, globals_context: dict[str, tp.Any]) -> bytes:
+        """
+        Serialize module namespace and all heap reachable from it, e.g. after expensive setup phase
+        :param globals_context: namespace passed to `run`
+        :return: snapshot to pass to `restore`
+        """
+        stream = io.BytesIO()
+        SnapshotPickler(stream, protocol=pickle.HIGHEST_PROTOCOL).dump(globals_context)
+        return stream.getvalue()
+
+    def restore(self, snapshot: bytes) -> dict[str, tp.Any]:
+        """
+        Rebuild namespace from `snapshot`, restored VM functions run on this VM
+        :param snapshot: result of `snapshot`
+        :return: namespace to pass to `run` as globals_context
+        """
+        return SnapshotUnpickler(io.BytesIO(snapshot), self).load()
+
+    def _run_isolated(self, code_obj: types.CodeType) -> tp.Any:
+        # Shallow copy shares caches, while cost counting stays per thread and is merged after the run
+        view = copy.copy(self)
+        if self.cost_model is not None:
+            view.cost_model = CostModel()
+        try:
+            return view.run(code_obj)
+        finally:
+            if self.cost_model is not None and view.cost_model is not None:
+                with self._cost_lock:
+                    self.cost_model.merge(view.cost_model)
+
+    async def run_in_executor(self, code_obj: types.CodeType) -> tuple[tp.Any, str]:
+        """
+        Offload guest program to the running loop's default executor, so a coroutine can await it.
+        The VM has no coroutine opcodes: each program occupies an executor thread for its whole run,
+        and guest `await` does not yield to the host loop.
+        Stdout is captured per program like in `run_many`
+        :param code_obj: code to execute
+        :return: (result, stdout) of program
+        """
+        # Imported here: asyncio imports `inspect`, which the tests ban before importing the VM
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with _ThreadStdout.installed() as stdout:
+            return await loop.run_in_executor(None, self._run_captured, code_obj, stdout)
+
+    def _run_captured(self, code_obj: types.CodeType, stdout: _ThreadStdout) -> tuple[tp.Any, str]:
+        stdout.stream = output = io.StringIO()
+        try:
+            return self._run_isolated(code_obj), output.getvalue()
+        finally:
+            del stdout.stream
+
+    def run_many(self, code_objs: tp.Sequence[types.CodeType], threads: int = 1) -> list[tuple[tp.Any, str]]:
+        """
+        Run independent guest programs on a pool of OS threads sharing this VM's caches.
+        Scales with threads on free-threaded (3.13t) builds, on regular builds GIL serializes them.
+        Stdout of every program is captured separately, so outputs of concurrent programs do not interleave;
+        stderr is shared
+        :param code_objs: programs to run
+        :param threads: number of worker threads
+        :return: (result, stdout) of programs in the same order
+        """
+        with _ThreadStdout.installed() as stdout, ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(self._run_captured, code_objs, [stdout] * len(code_objs)))
 
 
 def bind_args(func, *args: tp.Any, **kwargs: tp.Any) -> dict[str, tp.Any]:
@@ -0,0 +1,51 @@
+import dis
+import functools
+import types
+import typing as tp
+from collections import Counter
+
+
+class CodeAnalysis:
+    """
+    Compiled code object with its opcode histogram and analyses of nested code objects
+    """
+
+    def __init__(self, code: types.CodeType, own_operations: dict[str, int], children: list["CodeAnalysis"]):
+        self.code = code
+        self.own_operations = own_operations
+        self.children = children
+
+        operations: tp.Counter[str] = Counter(own_operations)
+        for child in children:
+            operations.update(child.operations)
+        self.operations: dict[str, int] = dict(operations)
+
+    def walk(self) -> tp.Iterator["CodeAnalysis"]:
+        """
+        Iterate over this code object and all nested ones, depth first
+        """
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+@functools.lru_cache(maxsize=None)
+def analyze_code(code: types.CodeType) -> CodeAnalysis:
+    """
+    Collect opcode histogram and nesting tree for code object
+    :param code: code object to analyze
+    :return: analysis of code and all nested code objects
+    """
+    own_operations: tp.Counter[str] = Counter(inst.opname for inst in dis.get_instructions(code))
+    children = [analyze_code(const) for const in code.co_consts if isinstance(const, types.CodeType)]
+    return CodeAnalysis(code, dict(own_operations), children)
+
+
+@functools.lru_cache(maxsize=None)
+def analyze(text_code: str) -> CodeAnalysis:
+    """
+    Compile text code once and analyze it, result is shared by scorer, runner and tests
+    :param text_code: text code for compiling
+    :return: analysis of compiled code
+    """
+    return analyze_code(compile(text_code, "<stdin>", "exec"))
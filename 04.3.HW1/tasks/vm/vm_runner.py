@@ -1,31 +1,51 @@
+import builtins
 import dis
+import functools
+import hashlib
 import io
+import json
+import os
 import sys
 import traceback
 import types
 import typing as tp
 from contextlib import contextmanager
+from pathlib import Path
 
+import vm_analysis
 
-def compile_code(text_code: types.CodeType | str) -> types.CodeType:
+
+def compile_code(text_code: types.CodeType | str, verbose: bool = False) -> types.CodeType:
     """
     This is utility function with primary purpose to convert string code to code type.
-    Secondary purpose - print byte code for text_code and all nested text_code
+    Secondary purpose - print byte code for text_code and all nested text_code when verbose,
+    otherwise disassembly is left to `disassemble` and rendered only on demand
     :param text_code: text code for compiling
+    :param verbose: print text code and its disassembly right away
     :return: compiled code
     """
+    if verbose:
+        print(disassemble(text_code))
+
     if isinstance(text_code, str):
-        print("Text code:\n{}\n".format(text_code))
-        print("Disassembled code:\n")
-        dis.dis(text_code)
-        print("\n")
-        code = compile(text_code, "<stdin>", "exec")
-    else:
-        code = text_code
-
-    for const in code.co_consts:
-        if isinstance(const, types.CodeType):
-            compile_code(const)
+        return vm_analysis.analyze(text_code).code
+    return text_code
+
+
+@functools.lru_cache(maxsize=None)
+def disassemble(text_code: types.CodeType | str) -> str:
+    """
+    Render text code with byte code for it and all nested code objects.
+    Result is cached, so repeated failures of the same case are rendered once
+    :param text_code: text code or code object to disassemble
+    :return: printable disassembly
+    """
+    stream = io.StringIO()
+    if isinstance(text_code, str):
+        stream.write("Text code:\n{}\n\n".format(text_code))
+    stream.write("Disassembled code:\n\n")
+    dis.dis(text_code, file=stream)
+    stream.write("\n\n")
 
     # print("Disassembled code co params:\n")
     # print(
@@ -46,7 +66,7 @@ def compile_code(text_code: types.CodeType | str) -> types.CodeType:
     #         code.co_argcount)
     # )
 
-    return code
+    return stream.getvalue()
 
 
 @contextmanager
@@ -94,3 +114,292 @@ def execute(
     out = stdout.getvalue()
     err = stderr.getvalue()
     return out, err, exc_type
+
+
+class ReferenceCache:
+    """
+    On-disk store of CPython reference results (stdout, stderr, exc_type) for text code.
+    Entries are keyed by source hash, the whole file is bound to the interpreter version,
+    so results produced by another python are dropped on load.
+    Cache file is trusted as reference, so it must never be read from a submission tree in graded runs
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        """
+        :param path: cache file location, None keeps results in memory only
+        """
+        self._path = Path(path) if path is not None else None
+        self._entries: dict[str, list[str | None]] = {}
+        self._dirty = False
+
+        if self._path is not None and self._path.exists():
+            try:
+                data = json.loads(self._path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            if isinstance(data, dict) and data.get("version") == sys.version:
+                self._entries = data.get("entries", {})
+
+    @staticmethod
+    def key(text_code: str) -> str:
+        return hashlib.sha256(text_code.encode("utf-8")).hexdigest()
+
+    def get(self, text_code: str) -> tuple[str, str, type[BaseException] | None] | None:
+        entry = self._entries.get(self.key(text_code))
+        if entry is None:
+            return None
+
+        out, err, exc_name = entry
+        if exc_name is None:
+            return out or "", err or "", None
+        exc_type = getattr(builtins, exc_name, None)
+        if not (isinstance(exc_type, type) and issubclass(exc_type, BaseException)):
+            return None
+        return out or "", err or "", exc_type
+
+    def put(self, text_code: str, result: tuple[str, str, type[BaseException] | None]) -> None:
+        out, err, exc_type = result
+        # Only builtin exceptions can be restored by name, guest-defined ones are always recomputed
+        if exc_type is not None and getattr(builtins, exc_type.__name__, None) is not exc_type:
+            return
+        self._entries[self.key(text_code)] = [out, err, None if exc_type is None else exc_type.__name__]
+        self._dirty = True
+
+    def save(self) -> None:
+        if self._path is None or not self._dirty:
+            return
+        data = {"version": sys.version, "entries": self._entries}
+        tmp_path = self._path.with_name(self._path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+        self._dirty = False
+
+
+def execute_reference(
+    text_code: str, code: types.CodeType, cache: ReferenceCache | None = None
+) -> tuple[str, str, type[BaseException] | None]:
+    """
+    Capture CPython output for text code, reusing stored reference result when it is fresh
+    :param text_code: source of code object, used as cache key
+    :param code: compiled text code
+    :param cache: reference results store, None to always execute
+    :return: tuple of reference execution output
+    """
+    if cache is not None:
+        cached = cache.get(text_code)
+        if cached is not None:
+            return cached
+
+    globals_context: dict[str, tp.Any] = {}
+    result = execute(code, eval, globals_context, globals_context)
+
+    if cache is not None:
+        cache.put(text_code, result)
+    return result
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_WINDOW = 2048
+
+
+class _ChunkedWriter(io.TextIOBase):
+    """
+    Text stream cutting output into fixed-size chunks and handing each one to `_on_chunk`,
+    only current incomplete chunk is kept in memory
+    """
+
+    def __init__(self, chunk_size: int) -> None:
+        self._chunk_size = chunk_size
+        self._parts: list[str] = []
+        self._buffered = 0
+        self.chunks = 0
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        written = len(s)
+        self.size += written
+        while s:
+            take = min(len(s), self._chunk_size - self._buffered)
+            self._parts.append(s[:take])
+            self._buffered += take
+            s = s[take:]
+            if self._buffered == self._chunk_size:
+                self._emit()
+        return written
+
+    def finish(self) -> None:
+        if self._buffered:
+            self._emit()
+
+    def _emit(self) -> None:
+        chunk = "".join(self._parts)
+        self._parts, self._buffered = [], 0
+        self._on_chunk(self.chunks, chunk)
+        self.chunks += 1
+
+    def _on_chunk(self, index: int, chunk: str) -> None:
+        raise NotImplementedError
+
+
+class OutputDigest(_ChunkedWriter):
+    """
+    Remembers only digest of every chunk of written output
+    """
+
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        super().__init__(chunk_size)
+        self.digests: list[bytes] = []
+
+    def _on_chunk(self, index: int, chunk: str) -> None:
+        self.digests.append(hashlib.sha256(chunk.encode("utf-8", "surrogatepass")).digest())
+
+
+class _Discard(_ChunkedWriter):
+    """
+    Counts written chars and drops them, e.g. for stderr which is not compared
+    """
+
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        super().__init__(chunk_size)
+
+    def _on_chunk(self, index: int, chunk: str) -> None:
+        pass
+
+
+class _ChunkCapture(_ChunkedWriter):
+    def __init__(self, chunk_size: int, index: int) -> None:
+        super().__init__(chunk_size)
+        self._index = index
+        self.chunk = ""
+
+    def _on_chunk(self, index: int, chunk: str) -> None:
+        if index == self._index:
+            self.chunk = chunk
+
+
+class OutputComparator(OutputDigest):
+    """
+    Compares written output against reference digests chunk by chunk as it is produced,
+    keeps text of the first mismatching chunk only
+    """
+
+    def __init__(self, reference: OutputDigest, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        super().__init__(chunk_size)
+        self._reference = reference
+        self.mismatch_chunk: int | None = None
+        self.mismatch_text = ""
+
+    def _on_chunk(self, index: int, chunk: str) -> None:
+        if self.mismatch_chunk is not None:
+            return
+        digest = hashlib.sha256(chunk.encode("utf-8", "surrogatepass")).digest()
+        if index >= len(self._reference.digests) or self._reference.digests[index] != digest:
+            self.mismatch_chunk = index
+            self.mismatch_text = chunk
+
+    def finish(self) -> None:
+        super().finish()
+        if self.mismatch_chunk is None and self.chunks < len(self._reference.digests):
+            # Output ended early, first missing chunk is the mismatch
+            self.mismatch_chunk = self.chunks
+
+
+class StreamComparison:
+    def __init__(
+        self,
+        equal: bool,
+        vm_exc: type[BaseException] | None,
+        py_exc: type[BaseException] | None,
+        vm_size: int,
+        py_size: int,
+        mismatch_offset: int | None = None,
+        vm_window: str = "",
+        py_window: str = "",
+    ):
+        self.equal = equal
+        self.vm_exc = vm_exc
+        self.py_exc = py_exc
+        self.vm_size = vm_size
+        self.py_size = py_size
+        self.mismatch_offset = mismatch_offset
+        self.vm_window = vm_window
+        self.py_window = py_window
+
+    def __str__(self) -> str:
+        if self.equal:
+            return "Outputs are equal ({} chars)".format(self.vm_size)
+        return "\n".join([
+            "Outputs differ at char {} (vm: {} chars, reference: {} chars)".format(
+                self.mismatch_offset, self.vm_size, self.py_size
+            ),
+            "VM output around mismatch:\n{!r}".format(self.vm_window),
+            "Reference output around mismatch:\n{!r}".format(self.py_window),
+        ])
+
+
+def _run_into(
+    code: types.CodeType, func: tp.Callable[..., None], out: _ChunkedWriter, *args: tp.Any
+) -> type[BaseException] | None:
+    exc_type, exc_value, exc_traceback = None, None, None
+    with redirected(out=out, err=_Discard()):
+        try:
+            func(code, *args)
+        except Exception:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+    out.finish()
+
+    # Guest stderr is dropped, traceback goes to the real stderr like in `execute`
+    if exc_value:
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stderr)
+    return exc_type
+
+
+def _reference_args() -> tuple[dict[str, tp.Any], dict[str, tp.Any]]:
+    globals_context: dict[str, tp.Any] = {}
+    return globals_context, globals_context
+
+
+def compare_streaming(
+    code: types.CodeType,
+    func: tp.Callable[..., None],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    window: int = STREAM_WINDOW,
+) -> StreamComparison:
+    """
+    Compare stdout of func with CPython reference without keeping whole outputs in memory.
+    Reference output is reduced to chunk digests, VM output is checked against them while it is printed.
+    On mismatch reference is executed once more to extract text of the mismatching chunk
+    :param code: code object to calculate
+    :param func: function running code, e.g. `VirtualMachine().run`
+    :param chunk_size: number of chars digested at once
+    :param window: number of chars kept around first mismatch for diagnostics
+    :return: comparison result
+    """
+    reference = OutputDigest(chunk_size)
+    py_exc = _run_into(code, eval, reference, *_reference_args())
+
+    comparator = OutputComparator(reference, chunk_size)
+    vm_exc = _run_into(code, func, comparator)
+
+    if comparator.mismatch_chunk is None and comparator.size == reference.size:
+        return StreamComparison(True, vm_exc, py_exc, comparator.size, reference.size)
+
+    index = comparator.mismatch_chunk if comparator.mismatch_chunk is not None else comparator.chunks
+    capture = _ChunkCapture(chunk_size, index)
+    _run_into(code, eval, capture, *_reference_args())
+
+    vm_chunk, py_chunk = comparator.mismatch_text, capture.chunk
+    position = next(
+        (i for i, (a, b) in enumerate(zip(vm_chunk, py_chunk)) if a != b),
+        min(len(vm_chunk), len(py_chunk)),
+    )
+    start = max(0, position - window // 2)
+    return StreamComparison(
+        False, vm_exc, py_exc, comparator.size, reference.size,
+        mismatch_offset=index * chunk_size + position,
+        vm_window=vm_chunk[start:start + window],
+        py_window=py_chunk[start:start + window],
+    )
@@ -1,8 +1,9 @@
 import dis
 import json
-import types
 import typing as tp
-from collections import Counter, defaultdict
+from collections import Counter
+
+import vm_analysis
 
 # Operations grouped by complexity levels
 
@@ -141,12 +142,18 @@ def generate_stub_operations() -> None:
 
 
 class StatData:
-    def __init__(self, code: str, operations: dict[str, int]):
+    def __init__(self, code: str, operations: dict[str, int], level: int):
         self.code = code
         self.operations = operations
+        self.level = level
 
 
 class Scorer:
+    """
+    Keeps per-level histogram of tests up to date on every add/remove,
+    so scoring single test is O(1) and scoring whole suite is O(n)
+    """
+
     def __init__(
         self,
         tests: list[str],
@@ -155,11 +162,41 @@ class Scorer:
     ):
         self._level_scores = level_scores
         self._operations_levels = operations_levels
-        self._stat = [self._collect(test) for test in tests]
+        self._stat: dict[str, StatData] = {}
+        self._counts: tp.Counter[str] = Counter()
+        self._total_stat = {key: 0 for key in self._operations_levels}
+        self._level_stat = {level: 0 for level in self._level_scores}
+        self._levels: dict[str, int] = {}
+        for test in tests:
+            self.add_test(test)
 
     def _collect(self, text_code: str) -> StatData:
         operations = self.get_operations(text_code)
-        return StatData(text_code, operations)
+        return StatData(text_code, operations, self.get_test_level(operations))
+
+    def add_test(self, text_code: str) -> None:
+        stat = self._stat.get(text_code)
+        if stat is None:
+            stat = self._stat[text_code] = self._collect(text_code)
+            self._levels[text_code] = stat.level
+
+        self._counts[text_code] += 1
+        for key, value in stat.operations.items():
+            self._total_stat[key] += value
+        self._level_stat[stat.level] += 1
+
+    def remove_test(self, text_code: str) -> None:
+        if not self._counts[text_code]:
+            raise KeyError("Test is not in the scorer")
+        stat = self._stat[text_code]
+
+        self._counts[text_code] -= 1
+        if not self._counts[text_code]:
+            del self._counts[text_code]
+            del self._stat[text_code]
+        for key, value in stat.operations.items():
+            self._total_stat[key] -= value
+        self._level_stat[stat.level] -= 1
 
     def get_level_operations_count(self) -> tp.Counter[int]:
         return Counter(self._operations_levels.values())
@@ -168,34 +205,21 @@ class Scorer:
         return len(self._operations_levels)
 
     def get_total_stats(self) -> dict[str, int]:
-        total_stat = {key: 0 for key in self._operations_levels}
-
-        for stat in self._stat:
-            for key, value in stat.operations.items():
-                total_stat[key] += value
-
-        return total_stat
+        return dict(self._total_stat)
 
     def get_levels_stats(self) -> dict[int, int]:
-        level_stats = {level: 0 for level in self._level_scores}
-
-        for stat in self._stat:
-            level = self.get_test_level(stat.operations)
-            level_stats[level] += 1
-
-        return level_stats
+        return dict(self._level_stat)
 
     def get_levels_coverage(self) -> dict[int, int]:
-        total_stats = self.get_total_stats()
         level_stats = {level: 0 for level in self._level_scores}
 
         for operation, level in self._operations_levels.items():
-            if total_stats[operation] > 0:
+            if self._total_stat[operation] > 0:
                 level_stats[level] += 1
         return level_stats
 
     def get_operations_coverage(self) -> int:
-        return sum(int(operations_count > 0) for operations_count in self.get_total_stats().values())
+        return sum(int(operations_count > 0) for operations_count in self._total_stat.values())
 
     def get_test_level(self, operations: dict[str, int]) -> int:
         level = 1
@@ -205,22 +229,14 @@ class Scorer:
 
         return level
 
-    def _extract_operations(self, code_obj: types.CodeType) -> dict[str, int]:
-        operations: tp.DefaultDict[str, int] = defaultdict(int)
-
-        for i in dis.get_instructions(code_obj):
-            operations[i.opname] += 1
-
-        for const in code_obj.co_consts:
-            if isinstance(const, types.CodeType):
-                for op, value in self._extract_operations(const).items():
-                    operations[op] += value
-
-        return operations
-
     def get_operations(self, text_code: str) -> dict[str, int]:
-        code = compile(text_code, "<stdin>", "exec")
-        return self._extract_operations(code)
+        return dict(vm_analysis.analyze(text_code).operations)
+
+    def _get_level(self, text_code: str) -> int:
+        level = self._levels.get(text_code)
+        if level is None:
+            level = self._levels[text_code] = self.get_test_level(self.get_operations(text_code))
+        return level
 
     def score(self, text_code: str) -> float:
         """
@@ -228,14 +244,11 @@ class Scorer:
         :param text_code: text code to identify personal score
         :return: score for text code
         """
-        operations = self.get_operations(text_code)
-        total_stats = self.get_levels_stats()
-
-        level = self.get_test_level(operations)
-        return self._level_scores[level] / total_stats[level]
+        level = self._get_level(text_code)
+        return self._level_scores[level] / self._level_stat[level]
 
     def total_score(self) -> float:
-        return sum(self.score(stat.code) for stat in self._stat)
+        return sum(self.score(code) * count for code, count in self._counts.items())
 
 
 def dump_tests_stat(stream: tp.TextIO, scorer: Scorer) -> None:
@@ -0,0 +1,123 @@
+"""
+Import-time report for task test packages: runs pytest collection of each task under `-X importtime`
+and shows cumulative import cost on top of bare pytest startup.
+Usage:
+    $ python tools/importtime_report.py                          # all tasks of the course
+    $ python tools/importtime_report.py 04.3.HW1/tasks/vm        # selected task directories
+    $ python tools/importtime_report.py --top 10 --csv out.csv   # more packages per task, csv for tracking
+"""
+
+import argparse
+import csv
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import typing as tp
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+@dataclass
+class ImportProfile:
+    total_us: int = 0
+    # Top-level imports (not imported by another module) with cumulative time in microseconds
+    packages: dict[str, int] = field(default_factory=dict)
+    error: str | None = None
+
+
+def parse_importtime(stderr: str) -> ImportProfile:
+    profile = ImportProfile()
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        profile.total_us += int(self_us)
+        if len(indent) == 1:
+            profile.packages[name] = profile.packages.get(name, 0) + int(cumulative_us)
+    return profile
+
+
+def profile_collection(path: Path, timeout: float = 300) -> ImportProfile:
+    """
+    Profile imports made by pytest collecting tests in path, as graded run does before any test
+    :param path: task directory
+    :param timeout: seconds to wait for collection
+    :return: import profile
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        str(ROOT / "tools" / "testlib"), os.environ.get("PYTHONPATH", "")
+    ])))
+    # Output capturing is off, otherwise pytest swallows importtime lines written during collection
+    cmd = [
+        sys.executable, "-X", "importtime", "-m", "pytest",
+        "--collect-only", "-q", "--capture=no", "-p", "no:cacheprovider", str(path),
+    ]
+    try:
+        process = subprocess.run(cmd, cwd=path, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return ImportProfile(error="timeout")
+    profile = parse_importtime(process.stderr)
+    if process.returncode not in (0, 5):  # 5 is "no tests collected"
+        profile.error = f"collection failed with exit code {process.returncode}"
+    return profile
+
+
+def find_tasks(root: Path = ROOT) -> list[Path]:
+    return sorted(path.parent for path in root.glob("*/tasks/*/test_*.py") if path.name != "test_private.py")
+
+
+def subtract(profile: ImportProfile, baseline: ImportProfile) -> ImportProfile:
+    packages = {name: us for name, us in profile.packages.items() if name not in baseline.packages}
+    return ImportProfile(total_us=sum(packages.values()), packages=packages, error=profile.error)
+
+
+def format_report(profiles: dict[str, ImportProfile], baseline: ImportProfile, top: int) -> str:
+    lines = [f"bare pytest startup imports: {baseline.total_us / 1000:.1f} ms", ""]
+    lines.append("{:<60} {:>12}  {}".format("task", "extra, ms", "heaviest extra imports"))
+    for name, profile in sorted(profiles.items(), key=lambda item: item[1].total_us, reverse=True):
+        if profile.error is not None:
+            lines.append("{:<60} {:>12}".format(name, profile.error))
+            continue
+        heaviest = sorted(profile.packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        lines.append("{:<60} {:>12.1f}  {}".format(
+            name, profile.total_us / 1000, ", ".join(f"{package} {us / 1000:.1f}" for package, us in heaviest)
+        ))
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", type=Path, help="task directories, all tasks by default")
+    parser.add_argument("--top", type=int, default=5, help="heaviest extra imports shown per task")
+    parser.add_argument("--csv", type=Path, help="write per-task totals and package costs as csv")
+    args = parser.parse_args()
+
+    tasks = [path.resolve() for path in args.paths] or find_tasks()
+    with tempfile.TemporaryDirectory() as empty_dir:
+        baseline = profile_collection(Path(empty_dir))
+
+    profiles: dict[str, ImportProfile] = {}
+    for task in tasks:
+        name = str(task.relative_to(ROOT)) if task.is_relative_to(ROOT) else str(task)
+        profiles[name] = subtract(profile_collection(task), baseline)
+    print(format_report(profiles, baseline, args.top))
+
+    if args.csv is not None:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["task", "package", "cumulative_us"])
+            for name, profile in profiles.items():
+                rows: list[tuple[str, tp.Any]] = [("<total>", profile.total_us), *profile.packages.items()]
+                writer.writerows([name, package, us] for package, us in rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
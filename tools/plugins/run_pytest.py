@@ -1,13 +1,26 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import Field
 from pathlib import Path
+import json
+import os
 import re
+import sys
+import tempfile
 
 from checker.plugins import PluginABC, PluginOutput
 from checker.exceptions import PluginExecutionFailed
 from checker.plugins.scripts import RunScriptPlugin
 
+# Warm job entry is unpickled in forkserver by module name, so it lives in a module imported by absolute name
+if str(Path(__file__).resolve().parent) not in sys.path:
+    sys.path.append(str(Path(__file__).resolve().parent))
+import warm_pytest  # noqa: E402
+
+
+VM_TARGET = "04.3.HW1/tasks/vm"
+
 
 class RunPytestPlugin(RunScriptPlugin):
     """Plugin for running pytest."""
@@ -16,17 +29,53 @@ class RunPytestPlugin(RunScriptPlugin):
 
     class Args(PluginABC.Args):
         origin: str
-        target: str
-        timeout: int | None = None
+        target: str | list[str]
+        timeout: int | None = None  # for each target separately
         isolate: bool = False
         env_whitelist: list[str] = Field(default_factory=lambda: ['PATH'])
 
         coverage: bool | int | None = None
         allow_failures: bool = False
+        max_workers: int | None = None  # targets run concurrently, cpu count by default
+        vm_results_path: str | None = None  # keep per-case json results of VM task here, e.g. for dashboards
+        warm: bool = False  # fork pytest from preloaded forkserver instead of starting interpreter, not with isolate
 
     def _run(self, args: Args, *, verbose: bool = False) -> PluginOutput:
+        if args.warm and args.isolate:
+            # Warm jobs are forked from shared forkserver of checker, they can not run in isolated sandbox
+            raise PluginExecutionFailed("Options `warm` and `isolate` can not be used together")
+        if isinstance(args.target, str):
+            return self._run_target(args, args.target, verbose=verbose)
+
+        targets = args.target
+        max_workers = args.max_workers or min(len(targets), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(self._run_target, args, target, verbose=verbose) for target in targets]
+
+            outputs, percentages, failed = [], [], []
+            for target, future in zip(targets, futures):
+                try:
+                    result = future.result()
+                    output, percentage = result.output, result.percentage
+                except PluginExecutionFailed as e:
+                    output, percentage = e.output, getattr(e, "percentage", 0.0)
+                    failed.append(target)
+                outputs.append(f"=== {target} ===\n{output or ''}")
+                percentages.append(percentage)
+
+        output = "\n".join(outputs)
+        percentage = sum(percentages) / len(percentages) if percentages else 1.0
+        if failed:
+            raise PluginExecutionFailed(
+                f"{len(failed)} of {len(targets)} targets failed: {', '.join(failed)}",
+                output=output,
+                percentage=percentage,
+            )
+        return PluginOutput(output=output, percentage=percentage)
+
+    def _run_target(self, args: Args, target: str, *, verbose: bool = False) -> PluginOutput:
         tests_cmd = ['python', '-m', 'pytest']
-        is_vm_task = args.target == "04.3.HW1/tasks/vm"
+        is_vm_task = target == VM_TARGET
 
         if not verbose:
             tests_cmd += ['--no-header']
@@ -34,13 +83,24 @@ class RunPytestPlugin(RunScriptPlugin):
 
         if args.coverage:
             tests_cmd += ['--cov-report', 'term-missing']
-            tests_cmd += ['--cov', args.target]
+            tests_cmd += ['--cov', target]
             if args.coverage is not True:
                 tests_cmd += ['--cov-fail-under', str(args.coverage)]
         else:
             tests_cmd += ['-p', 'no:cov']
 
-        script_cmd = ' '.join(tests_cmd + [args.target])
+        results_path = None
+        if is_vm_task:
+            if args.vm_results_path is not None:
+                results_path = Path(args.origin, args.vm_results_path)
+            else:
+                fd, tmp_name = tempfile.mkstemp(prefix='vm_results_', suffix='.json')
+                os.close(fd)
+                results_path = Path(tmp_name)
+            results_path.unlink(missing_ok=True)
+            tests_cmd += ['--vm-results', str(results_path)]
+
+        script_cmd = ' '.join(tests_cmd + [target])
         # For VM task, ensure pytest exit code doesn't raise; we'll parse output ourselves
         if is_vm_task:
             script_cmd = f"{script_cmd} || true"
@@ -52,20 +112,52 @@ class RunPytestPlugin(RunScriptPlugin):
             isolate=args.isolate,
             env_whitelist=args.env_whitelist,
         )
-        result = super()._run(run_script_args, verbose=verbose)
-        # Parse score from stdout when VM task (no exception path due to '|| true')
-        if is_vm_task:
-            m = re.search(r"Summary score is:\s*([0-9]+(?:\.[0-9]+)?)", result.output or "")
-            if m:
-                score_val = float(m.group(1))
-                scorer_path = Path(args.origin) / args.target / 'vm_scorer.py'
-                text_sc = scorer_path.read_text(encoding='utf-8')
-                m_full = re.search(r"FULL_SCORE\s*=\s*([0-9]+(?:\.[0-9]+)?)", text_sc)
-                if m_full:
-                    full = float(m_full.group(1))
-                    if full > 0:
-                        result.percentage = score_val / full
+        try:
+            if args.warm:
+                result = self._run_warm(args, tests_cmd[3:] + [target], allow_failure=is_vm_task)
             else:
-                result.percentage = 0
-                
+                result = super()._run(run_script_args, verbose=verbose)
+            # Take score from results file when VM task (no exception path due to '|| true')
+            if results_path is not None:
+                percentage = self._vm_results_percentage(results_path)
+                if percentage is None:
+                    percentage = self._vm_percentage(Path(args.origin) / target, result.output or "", result.percentage)
+                result.percentage = percentage
+        finally:
+            if results_path is not None and args.vm_results_path is None:
+                results_path.unlink(missing_ok=True)
+
         return result
+
+    @staticmethod
+    def _run_warm(args: Args, pytest_args: list[str], *, allow_failure: bool = False) -> PluginOutput:
+        env = {name: os.environ[name] for name in args.env_whitelist if name in os.environ}
+        result = warm_pytest.run_warm(args.origin, pytest_args, env, args.timeout)
+        if result.timed_out:
+            raise PluginExecutionFailed(f"Script timed out after {args.timeout}s", output=result.output)
+        if result.exit_code != 0 and not allow_failure:
+            raise PluginExecutionFailed(f"Script failed with exit code {result.exit_code}", output=result.output)
+        return PluginOutput(output=result.output)
+
+    @staticmethod
+    def _vm_results_percentage(results_path: Path) -> float | None:
+        try:
+            results = json.loads(results_path.read_text(encoding='utf-8'))
+            score, full = float(results['score']), float(results['full_score'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return score / full if full > 0 else None
+
+    @staticmethod
+    def _vm_percentage(task_path: Path, output: str, default: float) -> float:
+        m = re.search(r"Summary score is:\s*([0-9]+(?:\.[0-9]+)?)", output)
+        if not m:
+            return 0
+        score_val = float(m.group(1))
+        text_sc = (task_path / 'vm_scorer.py').read_text(encoding='utf-8')
+        m_full = re.search(r"FULL_SCORE\s*=\s*([0-9]+(?:\.[0-9]+)?)", text_sc)
+        if m_full:
+            full = float(m_full.group(1))
+            if full > 0:
+                return score_val / full
+        return default
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import warm_pytest  # noqa: E402
+
+
+pytestmark = pytest.mark.skipif(
+    'forkserver' not in multiprocessing.get_all_start_methods(),
+    reason='forkserver is unavailable on this platform',
+)
+
+PASSING = '''
+def test_ok():
+    assert 1 + 1 == 2
+'''
+
+FAILING = '''
+def test_fail():
+    print("failure output")
+    assert False
+'''
+
+SLOW = '''
+import time
+
+
+def test_slow():
+    time.sleep(60)
+'''
+
+
+def _write_task(path: Path, source: str) -> Path:
+    path.mkdir()
+    (path / 'test_task.py').write_text(source)
+    return path
+
+
+def _env() -> dict[str, str]:
+    return {'PATH': os.environ.get('PATH', '')}
+
+
+def test_passing(tmp_path: Path) -> None:
+    task = _write_task(tmp_path / 'task', PASSING)
+    result = warm_pytest.run_warm(str(task), ['-p', 'no:cacheprovider', 'test_task.py'], _env(), timeout=60)
+    assert not result.timed_out
+    assert result.exit_code == 0, result.output
+    assert '1 passed' in result.output
+
+
+def test_failing(tmp_path: Path) -> None:
+    task = _write_task(tmp_path / 'task', FAILING)
+    result = warm_pytest.run_warm(str(task), ['-p', 'no:cacheprovider', 'test_task.py'], _env(), timeout=60)
+    assert result.exit_code == 1
+    assert '1 failed' in result.output
+    assert 'failure output' in result.output
+
+
+def test_environment_is_replaced(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    source = '''
+import os
+
+
+def test_env():
+    assert os.environ.get("WARM_SECRET") is None
+    assert os.environ["WARM_ALLOWED"] == "1"
+'''
+    task = _write_task(tmp_path / 'task', source)
+    monkeypatch.setenv('WARM_SECRET', 'leaked')
+    env = {**_env(), 'WARM_ALLOWED': '1'}
+    result = warm_pytest.run_warm(str(task), ['-p', 'no:cacheprovider', 'test_task.py'], env, timeout=60)
+    assert result.exit_code == 0, result.output
+
+
+def test_timeout(tmp_path: Path) -> None:
+    task = _write_task(tmp_path / 'task', SLOW)
+    result = warm_pytest.run_warm(str(task), ['-p', 'no:cacheprovider', 'test_task.py'], _env(), timeout=3)
+    assert result.timed_out
+
+
+LEAK_CHECK = '''
+def test_secret_not_visible():
+    with open("/proc/self/environ", "rb") as f:
+        assert b"WARM_SECRET" not in f.read()
+'''
+
+RUN_WITH_SECRET = '''
+import os, sys
+sys.path.append({plugins!r})
+import warm_pytest
+result = warm_pytest.run_warm({task!r}, ["-p", "no:cacheprovider", "test_task.py"], {{"PATH": os.environ["PATH"]}}, 60)
+print(result.output)
+sys.exit(result.exit_code)
+'''
+
+
+@pytest.mark.skipif(not Path('/proc/self/environ').exists(), reason='no /proc on this platform')
+def test_checker_environment_is_not_inherited(tmp_path: Path) -> None:
+    # Fresh interpreter, so that forkserver is started with the secret in checker environment
+    task = _write_task(tmp_path / 'task', LEAK_CHECK)
+    script = RUN_WITH_SECRET.format(plugins=str(Path(warm_pytest.__file__).parent), task=str(task))
+    env = {**os.environ, 'WARM_SECRET': 'hunter2'}
+    process = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, timeout=120)
+    assert process.returncode == 0, process.stdout + process.stderr
+    assert '1 passed' in process.stdout
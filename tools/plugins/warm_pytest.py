@@ -0,0 +1,112 @@
+"""
+Warm pytest runs: pytest is forked from a forkserver with heavy packages already imported
+instead of starting a new interpreter for every target.
+Forkserver unpickles job entry by module name, so this module is kept free of checker imports
+and should be imported by its absolute name `warm_pytest` with plugins dir on sys.path
+"""
+from __future__ import annotations
+
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import sys
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+
+# Heavy imports done once in forkserver, every warm job is forked from it with them already imported
+WARM_PRELOAD = ['numpy', 'polars', 'pytest']
+
+
+@dataclass
+class WarmResult:
+    output: str
+    exit_code: int | None
+    timed_out: bool
+
+
+_context: multiprocessing.context.BaseContext | None = None
+_server_env: dict[str, str] = {}
+_context_lock = threading.Lock()
+
+
+def get_context(env: dict[str, str]) -> multiprocessing.context.BaseContext:
+    """
+    Forkserver context with server running in environment of the first job.
+    Jobs are forked from the server, so its initial environment (seen in /proc/self/environ) is inherited
+    by submission code; the server is started with whitelisted variables only, never with the checker's ones
+    :param env: the whole environment of job to run
+    :return: context to create warm processes with
+    """
+    global _context, _server_env
+    with _context_lock:
+        if _context is None:
+            # Forkserver takes sys.path of the first start, plugins dir should be on it to import this module
+            plugins_dir = str(Path(__file__).resolve().parent)
+            if plugins_dir not in sys.path:
+                sys.path.append(plugins_dir)
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['warm_pytest', *WARM_PRELOAD])
+            _context, _server_env = context, dict(env)
+        elif not _server_env.items() <= env.items():
+            # Job would see variables of the server environment it is not allowed to
+            raise RuntimeError('Warm forkserver is already running with variables outside of job environment')
+
+        # Server inherits environment of process at its (re)start, it is swapped only for that moment
+        saved_env = dict(os.environ)
+        os.environ.clear()
+        os.environ.update(_server_env)
+        try:
+            multiprocessing.forkserver.ensure_running()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_env)
+        return _context
+
+
+def run_pytest_job(origin: str, pytest_args: list[str], env: dict[str, str], output_path: str) -> None:
+    """Entry of forked warm worker: runs pytest in-process like `python -m pytest` in origin would"""
+    import pytest
+
+    with open(output_path, 'w') as output:
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+    os.environ.clear()
+    os.environ.update(env)
+    os.chdir(origin)
+    sys.path.insert(0, origin)
+    exit_code = pytest.main(pytest_args)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(int(exit_code))
+
+
+def run_warm(origin: str, pytest_args: list[str], env: dict[str, str], timeout: float | None = None) -> WarmResult:
+    """
+    Run pytest with given arguments in origin directory in process forked from forkserver
+    :param origin: working directory of pytest
+    :param pytest_args: command line arguments of pytest
+    :param env: the whole environment of pytest process
+    :param timeout: seconds to wait for pytest, process is killed after that
+    :return: combined stdout and stderr of pytest with its exit code
+    """
+    fd, output_path = tempfile.mkstemp(prefix='run_pytest_', suffix='.log')
+    os.close(fd)
+    try:
+        if run_pytest_job.__module__ != 'warm_pytest':
+            raise RuntimeError(f'warm_pytest is imported as {run_pytest_job.__module__!r}, forkserver can not load it')
+        process = get_context(env).Process(
+            target=run_pytest_job, args=(str(Path(origin).resolve()), pytest_args, env, output_path)
+        )
+        process.start()
+        process.join(timeout)
+        timed_out = process.is_alive()
+        if timed_out:
+            process.kill()
+            process.join()
+        output = Path(output_path).read_text(errors='replace')
+    finally:
+        os.unlink(output_path)
+    return WarmResult(output=output, exit_code=process.exitcode, timed_out=timed_out)
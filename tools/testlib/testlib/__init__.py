@@ -1,6 +1,54 @@
-from . import docs  # noqa: F401
-from . import functions  # noqa: F401
-from . import modules  # noqa: F401
-from .docs import *  # noqa: F401, F403
-from .functions import *  # noqa: F401, F403
-from .modules import *  # noqa: F401, F403
+"""
+Submodules are imported lazily on first attribute access, so that importing testlib in a task test
+does not pull `inspect`, `dis`, `ast`, `multiprocessing` etc. until they are actually needed
+"""
+from __future__ import annotations
+
+import importlib
+import typing as tp
+
+if tp.TYPE_CHECKING:
+    from . import complexity, docs, functions, memory, modules  # noqa: F401
+    from .complexity import *  # noqa: F401, F403
+    from .docs import *  # noqa: F401, F403
+    from .functions import *  # noqa: F401, F403
+    from .memory import *  # noqa: F401, F403
+    from .modules import *  # noqa: F401, F403
+
+
+_SUBMODULES = ('complexity', 'docs', 'functions', 'memory', 'modules')
+
+_EXPORTS = {
+    'complexity': [
+        'COMPLEXITY_CLASSES', 'Fit', 'geometric_sizes', 'measure', 'fit', 'estimate_complexity',
+        'is_complexity_within',
+    ],
+    'docs': ['is_function_docstring_exists', 'is_class_docstring_exists'],
+    'functions': [
+        'is_input_unchanged', 'FingerprintError', 'get_fingerprint', 'is_regexp_used', 'InstructionIndex',
+        'get_instruction_index', 'clear_instruction_index_cache', 'is_bytecode_op_used', 'is_global_used',
+        'is_instruction_used',
+    ],
+    'memory': ['MemoryLimitExceeded', 'MemoryReport', 'MemoryWatchdog', 'get_rss', 'run_and_measure'],
+    'modules': [
+        'ImportAnalyzer', 'ImportCache', 'get_file_imports', 'get_module_imports', 'is_module_imported',
+        'are_modules_imported', 'is_module_imported_hard',
+    ],
+}
+_EXPORTED_FROM = {name: submodule for submodule, names in _EXPORTS.items() for name in names}
+
+__all__ = [*_SUBMODULES, *_EXPORTED_FROM]
+
+
+def __getattr__(name: str) -> tp.Any:
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    if name in _EXPORTED_FROM:
+        value = getattr(importlib.import_module(f'.{_EXPORTED_FROM[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import gc
+import math
+import time
+import typing as tp
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+
+# Complexity classes from the simplest to the most complex
+COMPLEXITY_CLASSES: dict[str, Callable[[float], float]] = {
+    'O(1)': lambda n: 1.0,
+    'O(log n)': lambda n: math.log2(n),
+    'O(n)': lambda n: n,
+    'O(n log n)': lambda n: n * math.log2(n),
+    'O(n^2)': lambda n: n * n,
+}
+# Simpler class is preferred if its relative fit error is at most that much worse than the best one,
+# noise level is typical relative error of timings which no model can explain
+SIMPLER_CLASS_TOLERANCE = 0.1
+NOISE_LEVEL = 0.03
+# Fits growing less than that over sizes range are taken as O(1), slow drift of timings is not a complexity
+MIN_GROWTH = 0.25
+# Fast functions are called repeatedly until single timing takes that many seconds
+MIN_TIMING = 2e-3
+MAX_CALLS = 100_000
+
+
+@dataclass
+class Fit:
+    complexity: str
+    constant: float
+    coefficient: float
+    error: float
+
+
+def geometric_sizes(min_n: int, max_n: int, count: int) -> list[int]:
+    assert 2 <= min_n < max_n and count >= 2
+    ratio = (max_n / min_n) ** (1 / (count - 1))
+    return sorted({round(min_n * ratio ** i) for i in range(count)})
+
+
+def measure(
+        func: Callable[..., tp.Any],
+        make_args: Callable[[int], tuple[tp.Any, ...]],
+        sizes: Sequence[int],
+        repeat: int = 5,
+        number: int | None = None,
+) -> list[tuple[int, float]]:
+    """
+    Time func on generated inputs of given sizes, minimum over repeats is taken as the least noisy estimate.
+    Inputs are generated anew for each repeat, outside of timing
+    :param func: function to time
+    :param make_args: positional arguments of func for input size n
+    :param sizes: input sizes
+    :param repeat: timings per size
+    :param number: calls per timing on the same input, by default chosen to make timing at least MIN_TIMING long;
+        functions changing their input should use 1
+    :return: (size, seconds per call) pairs
+    """
+    timings = []
+    gc_enabled = gc.isenabled()
+    try:
+        for n in sizes:
+            best = math.inf
+            calls = number
+            for _ in range(repeat):
+                args = make_args(n)
+                if calls is None:
+                    calls = _calibrate(func, args)
+                gc.collect()
+                gc.disable()
+                start = time.perf_counter()
+                for _ in range(calls):
+                    func(*args)
+                best = min(best, (time.perf_counter() - start) / calls)
+                if gc_enabled:
+                    gc.enable()
+            timings.append((n, best))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def _calibrate(func: Callable[..., tp.Any], args: tuple[tp.Any, ...]) -> int:
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(*args)
+        if time.perf_counter() - start >= MIN_TIMING or calls >= MAX_CALLS:
+            return calls
+        calls *= 10
+
+
+def _fit_model(timings: Sequence[tuple[int, float]], model: Callable[[float], float]) -> tuple[float, float, float]:
+    # Least squares of t = a + b * model(n) with relative errors, so that small sizes are not ignored
+    xs = [model(n) for n, _ in timings]
+    ts = [max(t, 1e-9) for _, t in timings]
+    ws = [1 / t ** 2 for t in ts]
+
+    sw = sum(ws)
+    sx = sum(w * x for w, x in zip(ws, xs))
+    st = sum(w * t for w, t in zip(ws, ts))
+    sxx = sum(w * x * x for w, x in zip(ws, xs))
+    sxt = sum(w * x * t for w, x, t in zip(ws, xs, ts))
+
+    det = sw * sxx - sx * sx
+    if det > 1e-12 * sw * sxx:
+        b = (sw * sxt - sx * st) / det
+        a = (st - b * sx) / sw
+    else:
+        a, b = st / sw, 0.0
+    if b < 0:
+        # Decreasing time is noise around constant
+        a, b = st / sw, 0.0
+    if a < 0:
+        a, b = 0.0, sxt / sxx
+
+    error = math.sqrt(sum(w * (a + b * x - t) ** 2 for w, x, t in zip(ws, xs, ts)) / len(ts))
+    return a, b, error
+
+
+def fit(timings: Sequence[tuple[int, float]]) -> list[Fit]:
+    """
+    Fit timings against every complexity class
+    :param timings: (size, seconds) pairs
+    :return: fits ordered from the best to the worst, simpler classes first among nearly equal ones
+    """
+    fits = []
+    for complexity, model in COMPLEXITY_CLASSES.items():
+        a, b, error = _fit_model(timings, model)
+        fits.append(Fit(complexity, a, b, error))
+
+    best_error = min(f.error for f in fits)
+    order = list(COMPLEXITY_CLASSES)
+
+    def key(f: Fit) -> tuple[bool, float]:
+        # Nearly-best fits are ordered by simplicity, others by error
+        close = f.error <= best_error * (1 + SIMPLER_CLASS_TOLERANCE) + NOISE_LEVEL
+        return not close, order.index(f.complexity) if close else f.error
+
+    fits.sort(key=key)
+    if not _is_growth_significant(fits[0], timings):
+        # Growth is within drift of timings, nothing to explain beyond constant
+        fits.sort(key=lambda f: f.complexity != 'O(1)')
+    return fits
+
+
+def _is_growth_significant(f: Fit, timings: Sequence[tuple[int, float]]) -> bool:
+    model = COMPLEXITY_CLASSES[f.complexity]
+    sizes = [n for n, _ in timings]
+    start = f.constant + f.coefficient * model(min(sizes))
+    growth = f.coefficient * (model(max(sizes)) - model(min(sizes)))
+    return growth > MIN_GROWTH * start
+
+
+def estimate_complexity(
+        func: Callable[..., tp.Any],
+        make_args: Callable[[int], tuple[tp.Any, ...]],
+        min_n: int = 1_000,
+        max_n: int = 100_000,
+        count: int = 8,
+        repeat: int = 5,
+        number: int | None = None,
+) -> Fit:
+    timings = measure(func, make_args, geometric_sizes(min_n, max_n, count), repeat, number)
+    return fit(timings)[0]
+
+
+def is_complexity_within(
+        func: Callable[..., tp.Any],
+        make_args: Callable[[int], tuple[tp.Any, ...]],
+        max_complexity: str,
+        min_n: int = 1_000,
+        max_n: int = 100_000,
+        count: int = 8,
+        repeat: int = 5,
+        number: int | None = None,
+) -> bool:
+    """
+    Check that empirical complexity of func is not worse than given one
+    :param func: function to check
+    :param make_args: positional arguments of func for input size n
+    :param max_complexity: one of COMPLEXITY_CLASSES keys, e.g. 'O(n log n)'
+    :param min_n: the smallest input size
+    :param max_n: the largest input size, sizes in between are geometric series
+    :param count: number of sizes
+    :param repeat: runs per size, minimum is taken
+    :param number: calls per run on the same input, see `measure`; functions changing their input should use 1
+    :return: whether the best fitting class is within max_complexity
+    Note: cache effects on inputs not fitting into CPU caches make linear code look like O(n log n),
+    keep max_n modest when telling these two apart
+    """
+    if max_complexity not in COMPLEXITY_CLASSES:
+        raise ValueError(f'Unknown complexity {max_complexity!r}, expected one of {list(COMPLEXITY_CLASSES)}')
+    best = estimate_complexity(func, make_args, min_n, max_n, count, repeat, number)
+    order = list(COMPLEXITY_CLASSES)
+    return order.index(best.complexity) <= order.index(max_complexity)
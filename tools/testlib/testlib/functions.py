@@ -1,19 +1,37 @@
+import collections
 import dis
+import hashlib
 import types
 import inspect
 import typing as tp
-from collections.abc import Callable, Generator
+import weakref
+from collections.abc import Callable, Generator, Hashable
 import copy
 
 
 def is_input_unchanged(
         func: Callable[..., tp.Any],
         input_args: tuple[tp.Any, ...] | None = None,
-        input_kwargs: dict[tp.Any, tp.Any] | None = None
+        input_kwargs: dict[tp.Any, tp.Any] | None = None,
+        fingerprint: bool = False,
 ) -> bool:
     input_args = input_args or ()
     input_kwargs = input_kwargs or {}
 
+    if fingerprint:
+        # Compare structural hashes instead of deep copies, for inputs too large to be copied
+        try:
+            before = get_fingerprint((input_args, input_kwargs))
+        except FingerprintError:
+            # Some object can not be hashed by value, compare copies instead
+            return is_input_unchanged(func, input_args, input_kwargs)
+        func(*input_args, **input_kwargs)
+        try:
+            return get_fingerprint((input_args, input_kwargs)) == before
+        except FingerprintError:
+            # Unhashable object appeared in the input, so it was changed
+            return False
+
     input_args_copy = copy.deepcopy(input_args)
     input_kwargs_copy = copy.deepcopy(input_kwargs)
 
@@ -22,6 +40,136 @@ def is_input_unchanged(
     return input_args == input_args_copy and input_kwargs == input_kwargs_copy
 
 
+_FINGERPRINT_BUFFER_CHUNK = 1 << 20
+_FINGERPRINT_SCALARS = (type(None), bool, int, float, complex, str)
+
+
+class FingerprintError(TypeError):
+    """Object state can not be hashed by value, e.g. C object with default repr"""
+
+
+def get_fingerprint(obj: tp.Any) -> bytes:
+    """
+    Structural hash of object: containers are walked, leaves are hashed, buffers (bytes, numpy arrays, ...)
+    are hashed in place through memoryview, so memory overhead does not depend on object size.
+    Stricter than `==`: e.g. reordered dict gets other fingerprint.
+    Raises FingerprintError for objects whose state is not reachable from python, see `_update_opaque_fingerprint`
+    """
+    hasher = hashlib.blake2b(digest_size=32)
+    _update_fingerprint(hasher, obj, set())
+    return hasher.digest()
+
+
+def _update_fingerprint(hasher: tp.Any, obj: tp.Any, path: set[int]) -> None:
+    obj_type = type(obj)
+    hasher.update(f'{obj_type.__module__}.{obj_type.__qualname__}('.encode())
+
+    if isinstance(obj, str):
+        # Encoded by bounded slices, length keeps content apart from the surrounding structure
+        hasher.update(f'{len(obj)}:'.encode())
+        for start in range(0, len(obj), _FINGERPRINT_BUFFER_CHUNK):
+            hasher.update(obj[start:start + _FINGERPRINT_BUFFER_CHUNK].encode('utf-8', 'surrogatepass'))
+    elif isinstance(obj, int):
+        # Raw bytes instead of repr: decimal conversion of huge ints is quadratic and limited in length
+        hasher.update(obj.to_bytes(obj.bit_length() // 8 + 1, 'little', signed=True))
+    elif isinstance(obj, _FINGERPRINT_SCALARS):
+        hasher.update(repr(obj).encode())
+    elif id(obj) in path:
+        # Reference cycle, the object is already being hashed up the stack
+        hasher.update(b'<cycle>')
+    elif not _update_buffer_fingerprint(hasher, obj):
+        path.add(id(obj))
+        try:
+            _update_container_fingerprint(hasher, obj, path)
+        finally:
+            path.discard(id(obj))
+    hasher.update(b')')
+
+
+def _update_buffer_fingerprint(hasher: tp.Any, obj: tp.Any) -> bool:
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return False
+    with view:
+        if view.format == 'O':  # numpy object arrays keep references, not data
+            return False
+        hasher.update(f'{view.format}{view.shape}'.encode())
+        if view.ndim == 0:  # numpy scalars and 0-d arrays
+            hasher.update(view.tobytes())
+        elif view.c_contiguous:
+            flat = view.cast('B')
+            for start in range(0, flat.nbytes, _FINGERPRINT_BUFFER_CHUNK):
+                hasher.update(flat[start:start + _FINGERPRINT_BUFFER_CHUNK])
+        else:
+            _update_strided_fingerprint(hasher, obj, view.nbytes // view.shape[0] if view.shape[0] else 0)
+    return True
+
+
+def _update_strided_fingerprint(hasher: tp.Any, obj: tp.Any, row_nbytes: int) -> None:
+    # Strided views (e.g. transposed arrays) can not be read in place, they are copied by bounded slices
+    # of the first axis; `obj` should support slicing, as numpy arrays do
+    rows = len(obj)
+    if row_nbytes > _FINGERPRINT_BUFFER_CHUNK and not isinstance(obj, memoryview):
+        for i in range(rows):
+            row = obj[i]
+            with memoryview(row) as view:
+                if view.ndim == 0 or view.c_contiguous:
+                    hasher.update(view.tobytes())
+                else:
+                    _update_strided_fingerprint(hasher, row, view.nbytes // view.shape[0] if view.shape[0] else 0)
+        return
+    step = max(1, _FINGERPRINT_BUFFER_CHUNK // max(1, row_nbytes))
+    for start in range(0, rows, step):
+        try:
+            chunk = memoryview(obj[start:start + step])
+        except (TypeError, NotImplementedError) as e:
+            raise FingerprintError(f'Can not slice strided buffer of {type(obj).__name__}') from e
+        with chunk:
+            hasher.update(chunk.tobytes())
+
+
+def _update_container_fingerprint(hasher: tp.Any, obj: tp.Any, path: set[int]) -> None:
+    if isinstance(obj, dict):
+        hasher.update(str(len(obj)).encode())
+        for key, value in obj.items():
+            _update_fingerprint(hasher, key, path)
+            _update_fingerprint(hasher, value, path)
+    elif isinstance(obj, (list, tuple, collections.deque)):
+        hasher.update(str(len(obj)).encode())
+        for item in obj:
+            _update_fingerprint(hasher, item, path)
+    elif isinstance(obj, (set, frozenset)):
+        # Iteration order of equal sets may differ, combine items order-independently
+        total = 0
+        for item in obj:
+            item_hasher = hashlib.blake2b(digest_size=32)
+            _update_fingerprint(item_hasher, item, path)
+            total = (total + int.from_bytes(item_hasher.digest(), 'big')) % (1 << 256)
+        hasher.update(f'{len(obj)}:{total}'.encode())
+    elif hasattr(obj, '__dict__') or hasattr(type(obj), '__slots__'):
+        state = dict(getattr(obj, '__dict__', {}))
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot not in ('__dict__', '__weakref__') and hasattr(obj, slot):
+                    state[slot] = getattr(obj, slot)
+        if isinstance(obj, (types.FunctionType, type, types.ModuleType)):
+            hasher.update(str(id(obj)).encode())
+        else:
+            _update_container_fingerprint(hasher, state, path)
+    else:
+        _update_opaque_fingerprint(hasher, obj)
+
+
+def _update_opaque_fingerprint(hasher: tp.Any, obj: tp.Any) -> None:
+    # Value-like objects (datetime, Decimal, range, ...) are hashable and have meaningful repr,
+    # default repr only has an address, so mutation of such object can not be detected
+    obj_type = type(obj)
+    if obj_type.__hash__ is None or obj_type.__repr__ is object.__repr__:
+        raise FingerprintError(f'Can not fingerprint object of type {obj_type.__qualname__}')
+    hasher.update(repr(obj).encode('utf-8', 'surrogatepass'))
+
+
 def is_regexp_used(func: Callable[..., tp.Any], substr: str) -> bool:
     return substr in inspect.getsource(func)
 
@@ -103,22 +251,65 @@ def _get_function_instructions(
             yield from _get_function_instructions(const, visited_names, base_func=base_func)
 
 
+class InstructionIndex:
+    """All instructions reachable from a function, collected in one traversal, with lookup sets"""
+
+    def __init__(self, func: Callable[..., tp.Any]) -> None:
+        self.instructions = tuple(_get_function_instructions(func))
+        self.opnames = {instr.opname for instr in self.instructions}
+        self.op_argvals: set[tuple[str, tp.Any]] = {
+            (instr.opname, instr.argval) for instr in self.instructions if isinstance(instr.argval, Hashable)
+        }
+        self._params: dict[str, set[tp.Any] | None] = {}
+
+    def has_opname(self, opname: str) -> bool:
+        return opname in self.opnames
+
+    def has_op_argval(self, opname: str, argval: tp.Any) -> bool:
+        return (opname, argval) in self.op_argvals
+
+    def has_value(self, param: str, value: tp.Any) -> bool:
+        if param not in self._params:
+            values = [getattr(instr, param) for instr in self.instructions]
+            self._params[param] = set(values) if all(isinstance(v, Hashable) for v in values) else None
+        param_values = self._params[param]
+        if param_values is not None and isinstance(value, Hashable):
+            try:
+                return value in param_values
+            except TypeError:  # e.g. tuple with unhashable items
+                pass
+        return any(getattr(instr, param) == value for instr in self.instructions)
+
+
+_INDEX_CACHE: weakref.WeakKeyDictionary[tp.Any, tuple[types.CodeType | None, InstructionIndex]] = \
+    weakref.WeakKeyDictionary()
+
+
+def get_instruction_index(func: Callable[..., tp.Any]) -> InstructionIndex:
+    # Index reflects globals at the moment of the first query; rebuilt if function's code is replaced
+    code = getattr(func, '__code__', None)
+    try:
+        cached = _INDEX_CACHE.get(func)
+    except TypeError:  # not weak-referenceable
+        return InstructionIndex(func)
+    if cached is not None and cached[0] is code:
+        return cached[1]
+    index = InstructionIndex(func)
+    _INDEX_CACHE[func] = (code, index)
+    return index
+
+
+def clear_instruction_index_cache() -> None:
+    _INDEX_CACHE.clear()
+
+
 def is_bytecode_op_used(func: Callable[..., tp.Any], value: str) -> bool:
-    return any(
-        getattr(instr, 'opname') == value for instr in _get_function_instructions(func)
-    )
+    return get_instruction_index(func).has_opname(value)
 
 
 def is_global_used(func: Callable[..., tp.Any], value: str) -> bool:
-    return any(
-        getattr(instr, 'opname') == 'LOAD_GLOBAL' and getattr(instr, 'argval') == value
-        for instr in _get_function_instructions(func)
-    )
+    return get_instruction_index(func).has_op_argval('LOAD_GLOBAL', value)
 
 
 def is_instruction_used(func: Callable[..., tp.Any], param: str, value: str | None = None) -> bool:
-    # if value is not None:
-    return any(
-        getattr(instr, param) == value for instr in _get_function_instructions(func)
-    )
-    # else:
+    return get_instruction_index(func).has_value(param, value)
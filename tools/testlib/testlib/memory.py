@@ -1,105 +1,279 @@
-# from os import environ, getpid
-# from sys import stderr
-# from threading import Thread, Event
-# from time import sleep
-#
-# from psutil import Process
-#
-# VERBOSE = int(environ.get("VERBOSE", "0"))
-# SLEEP_PERIOD = float(environ.get("WATCHDOG_PERIOD", "100")) / 1000.0  # in msec
-# WIDTH = int(environ.get("PLOT_WIDTH", "100")) // 5 * 5
-# SELF_PROCESS = Process(getpid())
-#
-#
-# class MemoryWatchdog(Thread):
-#     """
-#     This class implements thread watching for current process memory consumption.
-#     Watchdog may be configured using the environment variables above.
-#     """
-#
-#     def __init__(self, limit: int, is_baseline: bool = False) -> None:
-#         self._stop_event = Event()
-#         self.maximum_memory_usage = 0
-#         self.limit = limit
-#         self.limit_in_kib = limit // 1024
-#         self._is_baseline = is_baseline
-#
-#         if VERBOSE:
-#             # To not interfere with pytest output.
-#             print("", file=stderr)
-#             header = ""
-#             for i in range(0, WIDTH - 10, 10):
-#                 marking_in_kib = (i * self.limit // WIDTH) // 1024
-#                 header += str(marking_in_kib).ljust(10)
-#             header = header.ljust(WIDTH)
-#             header += str(self.limit_in_kib)
-#             header = " " * 10 + header
-#             print(header, file=stderr)
-#
-#         super().__init__()
-#
-#     def run(self) -> None:
-#         while True:
-#             if self._stop_event.is_set():
-#                 break
-#             usage = SELF_PROCESS.memory_info().rss
-#             usage_in_kib = usage // 1024
-#             self.maximum_memory_usage = max(self.maximum_memory_usage, usage)
-#
-#             if VERBOSE:
-#                 line = str(usage_in_kib).ljust(9) + "|" + "=" * min(WIDTH, usage * WIDTH // self.limit)
-#                 if usage > self.limit:
-#                     line += min(10, (usage - self.limit) * WIDTH // self.limit) * "X"
-#                 print(line, file=stderr)
-#
-#             sleep(SLEEP_PERIOD)
-#
-#         if not self._is_baseline:
-#             print("Maximum memory usage / limit (in KiB):",
-#                   self.maximum_memory_usage // 1024, "/", self.limit // 1024, file=stderr)
-#
-#     def stop(self) -> None:
-#         self._stop_event.set()
-#
-#
-# def memory_usage_psutil():
-#     import psutil
-#     # return the memory usage in MB
-#     process = psutil.Process(os.getpid())
-#     mem = process.get_memory_info()[0] / float(2 ** 20)
-#     return mem
-#
-#
-# def memory_usage_resource():
-#     import resource
-#     rusage_denom = 1024.
-#     if sys.platform == 'darwin':
-#         # ... it seems that in OSX the output is different units ...
-#         rusage_denom = rusage_denom * rusage_denom
-#     mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rusage_denom
-#     return mem
-#
-#
-# def memory_usage_ps():
-#     import subprocess
-#     out = subprocess.Popen(['ps', 'v', '-p', str(os.getpid())], stdout=subprocess.PIPE).communicate()[0].split(b'\n')
-#     vsz_index = out[0].split().index(b'RSS')
-#     mem = float(out[1].split()[vsz_index]) / 1024
-#     return mem
-#
-#
-# def _measure(func, args=None, kwargs=None):
-#
-#     func(*args, **kwargs)
-#     print(f'function_process {function_process}')
-#     function_process.start()
-#
-#     function_process.join() # this blocks until the process terminates
-#
-#
-# def run_and_measure(func, limit, args=None, kwargs=None):
-#     function_process = Process(target=func, args=args, kwargs=kwargs)
-#     print(f'function_process {function_process}')
-#     function_process.start()
-#
-#     function_process.join()  # this blocks until the process terminates
+from __future__ import annotations
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import typing as tp
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+
+VERBOSE = int(os.environ.get("VERBOSE", "0"))
+SLEEP_PERIOD = float(os.environ.get("WATCHDOG_PERIOD", "100")) / 1000.0  # in msec
+WIDTH = int(os.environ.get("PLOT_WIDTH", "100")) // 5 * 5
+
+MODE_RSS = 'rss'
+MODE_TRACEMALLOC = 'tracemalloc'
+
+
+class MemoryLimitExceeded(MemoryError):
+    def __init__(self, report: MemoryReport) -> None:
+        super().__init__(
+            f'Memory limit exceeded: {report.peak // 1024} KiB used, limit is {report.limit // 1024} KiB'
+        )
+        self.report = report
+
+
+@dataclass
+class MemoryReport:
+    """
+    Memory usage of function run in child process.
+    Usage is counted over baseline, memory of child process just before function call
+    """
+    limit: int
+    mode: str = MODE_RSS
+    baseline: int = 0
+    peak: int = 0
+    exceeded: bool = False
+    timed_out: bool = False
+    duration: float = 0.0
+    timeline: list[tuple[float, int]] = field(default_factory=list)  # (seconds from start, bytes used)
+    result: tp.Any = None
+
+    def add_sample(self, seconds: float, usage: int) -> None:
+        self.timeline.append((seconds, usage))
+        self.peak = max(self.peak, usage)
+        if usage > self.limit:
+            self.exceeded = True
+
+    def format_timeline(self, width: int = WIDTH) -> str:
+        lines = []
+        for seconds, usage in self.timeline:
+            line = f'{seconds:7.2f}s {usage // 1024:>9} KiB |' + '=' * min(width, usage * width // self.limit)
+            if usage > self.limit:
+                line += min(10, (usage - self.limit) * width // self.limit) * 'X'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def get_rss(pid: int | None = None) -> int | None:
+    """Resident set size of process in bytes, None if it can not be read"""
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if pid == os.getpid():
+        try:
+            import resource
+        except ImportError:
+            return None
+        # Peak instead of current usage, the best we can get without /proc
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return None
+
+
+class MemoryWatchdog(threading.Thread):
+    """
+    Thread sampling RSS of process with given pid every `period` seconds.
+    Process is killed as soon as its usage over baseline exceeds limit
+    """
+
+    def __init__(self, pid: int, report: MemoryReport, period: float = SLEEP_PERIOD) -> None:
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.report = report
+        self.period = period
+        self._stop_event = threading.Event()
+        self._start_time = time.perf_counter()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            rss = get_rss(self.pid)
+            if rss is None:
+                break
+            self.report.add_sample(time.perf_counter() - self._start_time, max(0, rss - self.report.baseline))
+            if self.report.exceeded:
+                _kill(self.pid)
+                break
+            self._stop_event.wait(self.period)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+def _kill(pid: int) -> None:
+    try:
+        os.kill(pid, 9)
+    except OSError:
+        pass
+
+
+class _TracemallocSampler(threading.Thread):
+    def __init__(self, report: MemoryReport, period: float, on_exceeded: Callable[[], None]) -> None:
+        super().__init__(daemon=True)
+        self.report = report
+        self.period = period
+        self.on_exceeded = on_exceeded
+        self._stop_event = threading.Event()
+        self._start_time = time.perf_counter()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.period):
+            self.sample()
+            if self.report.exceeded:
+                self.on_exceeded()
+                break
+
+    def sample(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        self.report.add_sample(time.perf_counter() - self._start_time, current)
+        self.report.peak = max(self.report.peak, peak)
+        self.report.exceeded = self.report.peak > self.report.limit
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+def _child(
+        conn: multiprocessing.connection.Connection,
+        func: Callable[..., tp.Any],
+        args: tuple[tp.Any, ...],
+        kwargs: dict[str, tp.Any],
+        report: MemoryReport,
+        period: float,
+) -> None:
+    sampler = None
+    if report.mode == MODE_TRACEMALLOC:
+        def on_exceeded() -> None:
+            conn.send(('done', report, None))
+            os._exit(1)
+        tracemalloc.start()
+        sampler = _TracemallocSampler(report, period, on_exceeded)
+        sampler.start()
+    else:
+        report.baseline = get_rss() or 0
+        conn.send(('baseline', report.baseline))
+
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        result = func(*args, **kwargs)
+    except BaseException as e:
+        error = e
+
+    if sampler is not None:
+        sampler.stop()
+        sampler.sample()
+        tracemalloc.stop()
+        if report.exceeded:
+            sampler.on_exceeded()
+    else:
+        # Short runs may finish before the first sample of watchdog
+        report.add_sample(time.perf_counter() - start, max(0, (get_rss() or 0) - report.baseline))
+    report.result = result
+    try:
+        conn.send(('done', report, error))
+    except Exception as e:  # unpicklable result or exception
+        report.result = None
+        conn.send(('done', report, RuntimeError(f'Can not send result of {func!r} from child process: {e!r}')))
+
+
+def run_and_measure(
+        func: Callable[..., tp.Any],
+        limit: int,
+        args: tuple[tp.Any, ...] | None = None,
+        kwargs: dict[str, tp.Any] | None = None,
+        period: float = SLEEP_PERIOD,
+        mode: str = MODE_RSS,
+        timeout: float | None = None,
+        raise_on_limit: bool = True,
+) -> MemoryReport:
+    """
+    Run function in child process watching its memory usage.
+    In `rss` mode RSS of child is sampled from outside and child is killed on limit breach,
+    in `tracemalloc` mode python allocations are traced inside child, which is finer but slower
+    :param func: function to run, should be picklable where fork is unavailable
+    :param limit: allowed usage over baseline in bytes
+    :param args: positional arguments of func
+    :param kwargs: keyword arguments of func
+    :param period: sampling period in seconds
+    :param mode: `rss` or `tracemalloc`
+    :param timeout: seconds to wait for func, child is killed after that
+    :param raise_on_limit: raise MemoryLimitExceeded on breach instead of returning report
+    :return: report with peak usage, timeline and result of func
+    """
+    if mode not in (MODE_RSS, MODE_TRACEMALLOC):
+        raise ValueError(f'Unknown memory measure mode {mode!r}')
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    report = MemoryReport(limit=limit, mode=mode)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(sender, func, args or (), kwargs or {}, report, period))
+
+    start = time.perf_counter()
+    process.start()
+    sender.close()
+    deadline = None if timeout is None else start + timeout
+
+    watchdog = None
+    error: BaseException | None = None
+    try:
+        while True:
+            wait = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not receiver.poll(wait):
+                report.timed_out = True
+                break
+            try:
+                kind, *payload = receiver.recv()
+            except EOFError:  # killed by watchdog or crashed
+                break
+            if kind == 'baseline':
+                report.baseline = payload[0]
+                watchdog = MemoryWatchdog(process.pid, report, period)
+                watchdog.start()
+            else:
+                child_report, error = payload
+                if watchdog is not None:
+                    watchdog.stop()
+                child_report.timeline = report.timeline + child_report.timeline
+                child_report.peak = max(report.peak, child_report.peak)
+                child_report.exceeded = report.exceeded or child_report.exceeded
+                child_report.baseline = report.baseline
+                report = child_report
+                break
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+        if process.is_alive() and (report.timed_out or report.exceeded):
+            _kill(process.pid)
+        process.join()
+        receiver.close()
+    report.duration = time.perf_counter() - start
+
+    if VERBOSE:
+        print(report.format_timeline(), file=sys.stderr)
+        print('Maximum memory usage / limit (in KiB):', report.peak // 1024, '/', limit // 1024, file=sys.stderr)
+
+    if report.exceeded and raise_on_limit:
+        raise MemoryLimitExceeded(report)
+    if report.timed_out:
+        raise TimeoutError(f'{func!r} did not finish in {timeout} seconds')
+    if error is not None:
+        raise error
+    if process.exitcode != 0 and not report.exceeded:
+        raise RuntimeError(f'Child process running {func!r} died with exit code {process.exitcode}')
+    return report
@@ -1,6 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Iterable
 from pathlib import Path
+import json
+import os
 import sys
 import ast
+import threading
+
+
+# Env variable with path to json file keeping import cache between processes
+IMPORT_CACHE_ENV = 'TESTLIB_IMPORT_CACHE'
+# Cold start with at least that many unparsed files is parsed in process pool
+PARALLEL_PARSE_THRESHOLD = 64
 
 
 class ImportAnalyzer(ast.NodeVisitor):
@@ -19,14 +30,10 @@ class ImportAnalyzer(ast.NodeVisitor):
             self.from_imports.add(node.module.split(".")[0])
 
     def get_imports(self) -> tuple[set[str], set[str]]:
-        print(f'{self.from_imports=}, {self.direct_imports=}')
         return self.from_imports, self.direct_imports
 
 
-def get_file_imports(filepath: str | Path) -> set[str]:
-    filepath = Path(filepath)
-    assert filepath.exists() and filepath.is_file()
-
+def _parse_file_imports(filepath: str) -> set[str]:
     with open(filepath) as f:
         tree = ast.parse(f.read())
 
@@ -37,6 +44,92 @@ def get_file_imports(filepath: str | Path) -> set[str]:
     return {*from_imports, *direct_imports}
 
 
+class ImportCache:
+    """Imports of parsed files, entry is valid while file's (mtime, size) is unchanged"""
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        self.path = Path(path) if path is not None else None
+        self._entries: dict[str, tuple[int, int, frozenset[str]]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if self.path is not None and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+                self._entries = {
+                    filepath: (mtime, size, frozenset(imports)) for filepath, (mtime, size, imports) in data.items()
+                }
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def _stat(filepath: Path) -> tuple[str, int, int]:
+        stat = filepath.stat()
+        return str(filepath.resolve()), stat.st_mtime_ns, stat.st_size
+
+    def get_imports(self, filepaths: Iterable[Path]) -> dict[Path, frozenset[str]]:
+        result: dict[Path, frozenset[str]] = {}
+        missed: list[tuple[Path, str, int, int]] = []
+        with self._lock:
+            for filepath in filepaths:
+                key, mtime, size = self._stat(filepath)
+                entry = self._entries.get(key)
+                if entry is not None and entry[:2] == (mtime, size):
+                    result[filepath] = entry[2]
+                else:
+                    missed.append((filepath, key, mtime, size))
+
+        if missed:
+            parsed = _parse_many([key for _, key, _, _ in missed])
+            with self._lock:
+                for (filepath, key, mtime, size), imports in zip(missed, parsed):
+                    self._entries[key] = (mtime, size, frozenset(imports))
+                    result[filepath] = self._entries[key][2]
+                self._dirty = True
+            self.save()
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {
+                filepath: [mtime, size, sorted(imports)] for filepath, (mtime, size, imports) in self._entries.items()
+            }
+            self._dirty = False
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            tmp_path.write_text(json.dumps(data))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+
+
+def _parse_many(filepaths: list[str]) -> list[set[str]]:
+    if len(filepaths) >= PARALLEL_PARSE_THRESHOLD and (os.cpu_count() or 1) > 1:
+        try:
+            with ProcessPoolExecutor() as executor:
+                return list(executor.map(_parse_file_imports, filepaths, chunksize=16))
+        except (OSError, NotImplementedError):
+            # No process support in sandbox, parse in place
+            pass
+    return [_parse_file_imports(filepath) for filepath in filepaths]
+
+
+IMPORT_CACHE = ImportCache(os.environ.get(IMPORT_CACHE_ENV))
+
+
+def get_file_imports(filepath: str | Path) -> set[str]:
+    filepath = Path(filepath)
+    assert filepath.exists() and filepath.is_file()
+
+    return set(IMPORT_CACHE.get_imports([filepath])[filepath])
+
+
 def get_module_imports(path: str | Path) -> set[str]:
     path = Path(path)
     assert path.exists()
@@ -45,8 +138,8 @@ def get_module_imports(path: str | Path) -> set[str]:
         return get_file_imports(path)
     else:
         imports: set[str] = set()
-        for filepath in path.glob('**/*.py'):
-            imports.update(get_file_imports(filepath))
+        for file_imports in IMPORT_CACHE.get_imports(path.glob('**/*.py')).values():
+            imports.update(file_imports)
         return imports
 
 
@@ -54,5 +147,10 @@ def is_module_imported(module_name: str, path: str | Path) -> bool:
     return module_name in get_module_imports(path)
 
 
+def are_modules_imported(module_names: Iterable[str], path: str | Path) -> dict[str, bool]:
+    imports = get_module_imports(path)
+    return {module_name: module_name in imports for module_name in module_names}
+
+
 def is_module_imported_hard(module_name: str) -> bool:
     return module_name in sys.modules
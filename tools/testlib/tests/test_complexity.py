@@ -0,0 +1,99 @@
+import gc
+import math
+import os
+import random
+import typing as tp
+from collections.abc import Callable
+
+import pytest
+
+from testlib.complexity import COMPLEXITY_CLASSES, fit, geometric_sizes, is_complexity_within, measure
+
+
+SIZES = geometric_sizes(1_000, 1_000_000, 10)
+# Real timings are spoiled by bursts of load from other processes, those pass on retry while wrong verdicts do not
+TIMING_ATTEMPTS = 3
+
+
+@pytest.mark.parametrize('complexity', list(COMPLEXITY_CLASSES))
+def test_fit_synthetic(complexity: str) -> None:
+    model = COMPLEXITY_CLASSES[complexity]
+    rng = random.Random(42)
+    timings = [(n, (1e-5 + 1e-3 * model(n) / model(SIZES[-1])) * rng.uniform(0.97, 1.03)) for n in SIZES]
+    assert fit(timings)[0].complexity == complexity
+
+
+def test_geometric_sizes() -> None:
+    sizes = geometric_sizes(10, 1000, 3)
+    assert sizes == [10, 100, 1000]
+
+
+def test_measure_keeps_gc_disabled() -> None:
+    gc.disable()
+    try:
+        measure(lambda a: gc.isenabled() and 1 / 0, _make_list, [10, 20], repeat=2)
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+    measure(lambda a: None, _make_list, [10, 20], repeat=2)
+    assert gc.isenabled()
+
+
+def test_number_is_passed_through() -> None:
+    calls = []
+    is_complexity_within(calls.append, _make_list, 'O(n)', min_n=10, max_n=100, count=3, repeat=2, number=1)
+    # One call per generated input, so that functions changing their input are timed on fresh ones
+    assert len(calls) == 3 * 2
+
+
+def _quadratic(a: list[int]) -> int:
+    return sum(1 for x in a for y in a if x < y)
+
+
+def _linear(a: list[int]) -> int:
+    return sum(a)
+
+
+def _constant(a: list[int]) -> int:
+    return a[len(a) // 2]
+
+
+def _make_list(n: int) -> tuple[list[int]]:
+    return list(range(n)),
+
+
+CHECKS: list[tuple[Callable[..., tp.Any], str, bool, int, int]] = [
+    (_constant, 'O(1)', True, 1_000, 100_000),
+    (_linear, 'O(n)', True, 1_000, 100_000),
+    (_linear, 'O(n^2)', True, 1_000, 100_000),
+    (_quadratic, 'O(n)', False, 100, 1_000),
+    (_quadratic, 'O(n log n)', False, 100, 1_000),
+]
+
+
+@pytest.mark.skipif(
+    os.environ.get('TESTLIB_TIMING_TESTS', '0') == '0',
+    reason='real timings depend on machine load, set TESTLIB_TIMING_TESTS=1 to run',
+)
+@pytest.mark.parametrize('func,complexity,expected,min_n,max_n', CHECKS)
+def test_is_complexity_within(
+        func: Callable[..., tp.Any], complexity: str, expected: bool, min_n: int, max_n: int
+) -> None:
+    verdicts = []
+    for _ in range(TIMING_ATTEMPTS):
+        verdicts.append(is_complexity_within(func, _make_list, complexity, min_n=min_n, max_n=max_n, count=6, repeat=3))
+        if verdicts[-1] == expected:
+            break
+    assert verdicts[-1] == expected, f'{func.__name__} within {complexity}: {verdicts}'
+
+
+def test_unknown_complexity() -> None:
+    with pytest.raises(ValueError):
+        is_complexity_within(_linear, _make_list, 'O(2^n)')
+
+
+def test_fit_constant_noise() -> None:
+    rng = random.Random(0)
+    timings = [(n, 1e-6 * rng.uniform(0.8, 1.2)) for n in SIZES]
+    assert fit(timings)[0].complexity == 'O(1)'
+    assert math.isfinite(fit(timings)[0].error)
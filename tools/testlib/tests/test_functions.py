@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import copy
+import tracemalloc
 import types
 import typing as tp
 from dataclasses import dataclass, field
 from inspect import cleandoc
+from unittest.mock import patch
 
 import pytest
 
 from testlib.functions import is_input_unchanged, is_instruction_used, is_regexp_used, is_bytecode_op_used, is_global_used, _get_function_instructions
+from testlib.functions import FingerprintError, get_fingerprint, get_instruction_index
 
 
 @dataclass
@@ -81,6 +84,118 @@ class TestInput:
         assert is_input_unchanged(_foo, input_args=([1, 2, 3],), input_kwargs={'b': {1: 2}})
 
 
+class TestInputFingerprint:
+    def test_args_changed(self) -> None:
+        def _foo(a: list[list[int]]) -> None:
+            a[1].append(1)
+
+        assert not is_input_unchanged(_foo, input_args=([[1], [2, 3]],), fingerprint=True)
+
+    def test_kwargs_changed(self) -> None:
+        def _foo(b: dict[str, tp.Any]) -> None:
+            b['c'].add(4)
+
+        assert not is_input_unchanged(_foo, input_kwargs={'b': {'c': {1, 2}}}, fingerprint=True)
+
+    def test_buffer_changed(self) -> None:
+        def _foo(a: bytearray) -> None:
+            a[-1] = 0
+
+        assert not is_input_unchanged(_foo, input_args=(bytearray(b'x' * 3_000_000),), fingerprint=True)
+
+    def test_object_changed(self) -> None:
+        @dataclass
+        class Point:
+            x: int
+            y: int
+
+        def _foo(p: Point) -> None:
+            p.x += 1
+
+        assert not is_input_unchanged(_foo, input_args=(Point(1, 2),), fingerprint=True)
+
+    def test_unchanged(self) -> None:
+        def _foo(a: list[tp.Any], b: dict[str, tp.Any]) -> None:
+            a = copy.deepcopy(a)
+            b = copy.deepcopy(b)
+            a.append(1)
+            b['123'] = '123'
+
+        data: list[tp.Any] = [1, 'a', b'bytes', bytearray(10), (1.5, None), {frozenset({1, 2})}]
+        data.append(data)
+        assert is_input_unchanged(_foo, input_args=(data,), input_kwargs={'b': {1: {'c': data}}}, fingerprint=True)
+
+    def test_fingerprint_equal_objects(self) -> None:
+        assert get_fingerprint({3, 2, 1, 'a'}) == get_fingerprint({'a', 1, 2, 3})
+        assert get_fingerprint([1, [2]]) == get_fingerprint([1, [2]])
+        assert get_fingerprint([1, 2]) != get_fingerprint((1, 2))
+        assert get_fingerprint(b'12') != get_fingerprint(bytearray(b'12'))
+
+    def test_opaque_object(self) -> None:
+        def _foo(a: list[tp.Any]) -> None:
+            pass
+
+        with pytest.raises(FingerprintError):
+            get_fingerprint([object()])
+        with patch('testlib.functions.copy.deepcopy', wraps=copy.deepcopy) as deepcopy:
+            is_input_unchanged(_foo, input_args=([object()],), fingerprint=True)
+        assert deepcopy.called
+
+    def test_scalars(self) -> None:
+        assert get_fingerprint(['a)', 'b']) != get_fingerprint(['a', ')b'])
+        assert get_fingerprint(10 ** 5000) != get_fingerprint(10 ** 5000 + 1)
+        assert get_fingerprint(-1) != get_fingerprint(255)
+        assert get_fingerprint(1) != get_fingerprint(True)
+
+    def test_str_memory_bounded(self) -> None:
+        text = 'a' * 50_000_000
+        tracemalloc.start()
+        try:
+            get_fingerprint(text)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 8 * 1024 * 1024
+
+
+class TestInputFingerprintNumpy:
+    @pytest.fixture
+    def np(self) -> tp.Any:
+        return pytest.importorskip('numpy')
+
+    def test_scalars(self, np: tp.Any) -> None:
+        def _foo(a: list[tp.Any]) -> None:
+            a[1][()] = 4.0
+
+        assert get_fingerprint([np.int32(5)]) != get_fingerprint([np.int32(6)])
+        assert is_input_unchanged(lambda a: None, input_args=([np.int32(5), np.array(3.0)],), fingerprint=True)
+        assert not is_input_unchanged(_foo, input_args=([np.int32(5), np.array(3.0)],), fingerprint=True)
+
+    def test_array_changed(self, np: tp.Any) -> None:
+        def _foo(a: tp.Any) -> None:
+            a[-1, -1] += 1
+
+        assert not is_input_unchanged(_foo, input_args=(np.zeros((100, 100)),), fingerprint=True)
+        assert not is_input_unchanged(_foo, input_args=(np.zeros((100, 100)).T,), fingerprint=True)
+        assert not is_input_unchanged(_foo, input_args=(np.zeros((2, 400_000))[:, ::2],), fingerprint=True)
+
+    def test_array_unchanged(self, np: tp.Any) -> None:
+        def _foo(a: tp.Any) -> None:
+            a.sum()
+
+        assert is_input_unchanged(_foo, input_args=(np.arange(1000).reshape(10, 100)[:, ::3],), fingerprint=True)
+
+    def test_strided_memory_bounded(self, np: tp.Any) -> None:
+        array = np.zeros((4, 2_000_000)).T  # 64 MB, not contiguous
+        tracemalloc.start()
+        try:
+            get_fingerprint(array)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 8 * 1024 * 1024
+
+
 @dataclass
 class RegexpTestCase(FunctionTestCase):
     used_regexp: set[str] = field(default_factory=set)
@@ -390,4 +505,39 @@ class TestInstructions:
             assert not is_global_used(obj, inst)
 
 
+class TestInstructionIndex:
+    def test_index_is_cached(self) -> None:
+        def foo() -> None:
+            sorted([1, 2, 3])
+
+        assert get_instruction_index(foo) is get_instruction_index(foo)
+
+    def test_index_rebuilt_on_code_change(self) -> None:
+        def foo() -> None:
+            sorted([1, 2, 3])
+
+        def bar() -> None:
+            len([1, 2, 3])
+
+        assert is_global_used(foo, 'sorted')
+        foo.__code__ = bar.__code__
+        assert not is_global_used(foo, 'sorted')
+        assert is_global_used(foo, 'len')
+
+    def test_index_matches_traversal(self) -> None:
+        case = BYTECODE_OP_TEST_CASES[-1]
+        instructions = list(_get_function_instructions(case.obj))
+        index = get_instruction_index(case.obj)
+
+        assert list(index.instructions) == instructions
+        for instr in instructions:
+            assert is_bytecode_op_used(case.obj, instr.opname)
+            assert is_instruction_used(case.obj, 'argval', instr.argval)
+        assert not is_instruction_used(case.obj, 'argval', 'surely_not_used_name')
+
+    def test_unhashable_values(self) -> None:
+        def foo() -> None:
+            sorted([1, 2, 3])
 
+        assert is_instruction_used(foo, 'positions', get_instruction_index(foo).instructions[0].positions)
+        assert not is_instruction_used(foo, 'argval', [1, 2, 3])
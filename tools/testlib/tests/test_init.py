@@ -0,0 +1,44 @@
+import importlib
+import subprocess
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+import testlib
+
+
+SUBMODULES = ['complexity', 'docs', 'functions', 'memory', 'modules']
+
+
+@pytest.mark.parametrize('submodule', SUBMODULES)
+def test_public_api_exported(submodule: str) -> None:
+    module = importlib.import_module(f'testlib.{submodule}')
+    for name, value in vars(module).items():
+        is_defined_here = getattr(value, '__module__', None) == module.__name__
+        if name.startswith('_') or not is_defined_here or not isinstance(value, (type, types.FunctionType)):
+            continue
+        assert name in testlib.__all__, f'testlib.{submodule}.{name} is not exported by testlib'
+        assert getattr(testlib, name) is value
+
+
+def test_lazy_import() -> None:
+    # Isolated and without site, so .pth files of installed packages can not import anything beforehand
+    code = (
+        f'import sys; sys.path.insert(0, {str(Path(testlib.__file__).parent.parent)!r}); '
+        'import testlib; '
+        'assert "testlib.functions" not in sys.modules and "dis" not in sys.modules; '
+        'testlib.is_global_used; '
+        'assert "testlib.functions" in sys.modules and "testlib.modules" not in sys.modules'
+    )
+    subprocess.run([sys.executable, '-I', '-S', '-c', code], check=True)
+
+
+def test_dir() -> None:
+    assert set(testlib.__all__) <= set(dir(testlib))
+
+
+def test_missing_attribute() -> None:
+    with pytest.raises(AttributeError):
+        testlib.surely_missing_attribute
@@ -0,0 +1,57 @@
+import pytest
+
+from testlib.memory import MODE_TRACEMALLOC, MemoryLimitExceeded, get_rss, run_and_measure
+
+
+MiB = 1024 * 1024
+
+
+def _allocate(size: int) -> int:
+    data = bytearray(size)
+    data[::4096] = b'x' * len(data[::4096])  # touch pages so they become resident
+    return len(data)
+
+
+def _fail() -> None:
+    raise ValueError('expected')
+
+
+@pytest.mark.skipif(get_rss() is None, reason='RSS can not be read on this platform')
+class TestRunAndMeasure:
+    def test_result_returned(self) -> None:
+        report = run_and_measure(_allocate, limit=64 * MiB, args=(MiB,), period=0.01)
+        assert report.result == MiB
+        assert not report.exceeded
+        assert report.timeline
+        assert report.peak <= 64 * MiB
+
+    def test_limit_exceeded(self) -> None:
+        with pytest.raises(MemoryLimitExceeded) as e:
+            run_and_measure(_allocate, limit=16 * MiB, args=(512 * MiB,), period=0.005)
+        assert e.value.report.exceeded
+        assert e.value.report.peak > 16 * MiB
+
+    def test_limit_exceeded_report(self) -> None:
+        report = run_and_measure(_allocate, limit=16 * MiB, args=(512 * MiB,), period=0.005, raise_on_limit=False)
+        assert report.exceeded
+        assert report.result is None
+        assert report.format_timeline()
+
+    def test_exception_propagated(self) -> None:
+        with pytest.raises(ValueError, match='expected'):
+            run_and_measure(_fail, limit=64 * MiB)
+
+
+class TestTracemalloc:
+    def test_peak_traced(self) -> None:
+        report = run_and_measure(_allocate, limit=64 * MiB, args=(8 * MiB,), mode=MODE_TRACEMALLOC, period=0.01)
+        assert report.result == 8 * MiB
+        assert 8 * MiB <= report.peak < 64 * MiB
+
+    def test_limit_exceeded(self) -> None:
+        with pytest.raises(MemoryLimitExceeded):
+            run_and_measure(_allocate, limit=4 * MiB, args=(8 * MiB,), mode=MODE_TRACEMALLOC, period=0.01)
+
+    def test_unknown_mode(self) -> None:
+        with pytest.raises(ValueError):
+            run_and_measure(_allocate, limit=MiB, args=(1,), mode='psutil')
@@ -3,10 +3,11 @@ from inspect import cleandoc
 from pathlib import Path
 from itertools import chain
 import uuid
+from unittest.mock import patch
 
 import pytest
 
-from testlib.modules import get_file_imports, get_module_imports
+from testlib.modules import ImportCache, are_modules_imported, get_file_imports, get_module_imports
 
 
 @dataclass
@@ -139,3 +140,40 @@ class TestImported:
 
         test_cases_modules = [case.modules for case in FILE_TEST_CASES]
         assert get_module_imports(tmp_path) == set(chain.from_iterable(test_cases_modules))
+
+
+class TestImportCache:
+    def test_file_changed(self, tmp_path: Path) -> None:
+        tmp_file = tmp_path / 'tmp.py'
+        tmp_file.write_text('import json\n')
+        assert get_file_imports(tmp_file) == {'json'}
+
+        tmp_file.write_text('import pickle, os\n')
+        assert get_file_imports(tmp_file) == {'pickle', 'os'}
+
+    def test_persistent(self, tmp_path: Path) -> None:
+        tmp_file = tmp_path / 'tmp.py'
+        tmp_file.write_text('import json\n')
+        cache_path = tmp_path / 'cache.json'
+
+        ImportCache(cache_path).get_imports([tmp_file])
+        assert cache_path.exists()
+
+        cache = ImportCache(cache_path)
+        with patch('testlib.modules._parse_many', side_effect=AssertionError('file was parsed again')):
+            assert cache.get_imports([tmp_file]) == {tmp_file: {'json'}}
+
+    def test_parallel_parse(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr('testlib.modules.PARALLEL_PARSE_THRESHOLD', 2)
+        for case in FILE_TEST_CASES:
+            (tmp_path / f'{uuid.uuid1()}.py').write_text(case.text_code)
+
+        test_cases_modules = [case.modules for case in FILE_TEST_CASES]
+        parsed = ImportCache().get_imports(tmp_path.glob('*.py'))
+        assert set(chain.from_iterable(parsed.values())) == set(chain.from_iterable(test_cases_modules))
+
+    def test_many_modules(self, tmp_path: Path) -> None:
+        tmp_file = tmp_path / 'tmp.py'
+        tmp_file.write_text(FILE_TEST_CASES[-1].text_code)
+
+        assert are_modules_imported(['sys', 'foo7', 'bar2'], tmp_path) == {'sys': True, 'foo7': False, 'bar2': True}